@@ -80,6 +80,7 @@ def main(argv: Sequence[str] | None = None) -> int:
         config=config,
         commit=commit,
         autofix_settings=autofix_settings,
+        sparse_paths=('/azure-pipelines.yml',),
     )
     return 0
 
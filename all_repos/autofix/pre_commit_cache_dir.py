@@ -6,7 +6,7 @@ from collections.abc import Sequence
 
 from all_repos import autofix_lib
 from all_repos.config import Config
-from all_repos.grep import repos_matching
+from all_repos.grep import repos_matching_any
 
 REPLACES = (
     (
@@ -23,11 +23,8 @@ REPLACES = (
 
 
 def find_repos(config: Config) -> set[str]:
-    return {
-        repo
-        for fname, pattern, _ in REPLACES
-        for repo in repos_matching(config, ('-F', pattern, '--', fname))
-    }
+    queries = [('-F', pattern, '--', fname) for fname, pattern, _ in REPLACES]
+    return repos_matching_any(config, queries)
 
 
 def _replace_if_exists(filename: str, s1: str, s2: str) -> None:
@@ -39,7 +36,7 @@ def _replace_if_exists(filename: str, s1: str, s2: str) -> None:
             f.write(contents)
 
 
-def apply_fix() -> None:
+def apply_fix(filenames: list[str]) -> None:
     for fname, find, replace in REPLACES:
         _replace_if_exists(fname, find, replace)
 
@@ -56,9 +53,10 @@ def main(argv: Sequence[str] | None = None) -> int:
         branch_name='pre-commit-cache-dir',
     )
 
-    autofix_lib.fix(
+    autofix_lib.fix_contents(
         repos,
-        apply_fix=apply_fix,
+        pathspecs=tuple(fname for fname, _, _ in REPLACES),
+        edit_files=apply_fix,
         config=config,
         commit=commit,
         autofix_settings=autofix_settings,
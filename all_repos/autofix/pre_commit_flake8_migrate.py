@@ -9,18 +9,18 @@ from all_repos.autofix._pre_commit_hook_migrate import apply_fix_fn
 from all_repos.autofix.pre_commit_autoupdate import check_fix
 from all_repos.autofix.pre_commit_autoupdate import tmp_pre_commit_home
 from all_repos.config import Config
-from all_repos.grep import repos_matching
+from all_repos.grep import repos_matching_batch
 
 
 def find_repos(config: Config) -> set[str]:
-    return (
-        repos_matching(
-            config, ('flake8', '--', '.pre-commit-config.yaml'),
-        ) -
-        repos_matching(
-            config, ('pycqa/flake8', '--', '.pre-commit-config.yaml'),
-        )
+    flake8, pycqa_flake8 = repos_matching_batch(
+        config,
+        (
+            ('flake8', '--', '.pre-commit-config.yaml'),
+            ('pycqa/flake8', '--', '.pre-commit-config.yaml'),
+        ),
     )
+    return flake8 - pycqa_flake8
 
 
 apply_fix = functools.partial(
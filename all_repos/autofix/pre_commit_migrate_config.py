@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import argparse
-import os.path
 import sys
 from collections.abc import Sequence
 
@@ -9,6 +8,7 @@ import yaml
 from pre_commit.constants import CONFIG_FILE
 
 from all_repos import autofix_lib
+from all_repos import cat_file
 from all_repos.autofix.pre_commit_autoupdate import check_fix
 from all_repos.autofix.pre_commit_autoupdate import find_repos as _find_repos
 from all_repos.autofix.pre_commit_autoupdate import tmp_pre_commit_home
@@ -20,9 +20,10 @@ def apply_fix() -> None:
 
 
 def _has_legacy_config(repo_dir: str) -> bool:
-    with open(os.path.join(repo_dir, CONFIG_FILE)) as f:
-        contents = yaml.safe_load(f.read())
-    return isinstance(contents, list)
+    # read from HEAD rather than trusting the working directory
+    with cat_file.batch(repo_dir) as batch:
+        contents = batch.read_blob(CONFIG_FILE)
+    return contents is not None and isinstance(yaml.safe_load(contents), list)
 
 
 def find_repos(config: Config) -> set[str]:
@@ -1,30 +1,41 @@
 from __future__ import annotations
 
 import argparse
+import concurrent.futures
 import contextlib
 import functools
 import importlib.metadata
+import itertools
+import json
 import os
 import shlex
+import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import traceback
+import urllib.parse
 from collections.abc import Callable
 from collections.abc import Generator
 from collections.abc import Iterable
+from collections.abc import Sequence
 from typing import Any
+from typing import IO
 from typing import NamedTuple
 from typing import NoReturn
 
 from packaging.version import Version
 
+from all_repos import cat_file
 from all_repos import cli
 from all_repos import color
 from all_repos import git
+from all_repos import http_pool
 from all_repos import mapper
 from all_repos.config import Config
 from all_repos.config import load_config
+from all_repos.util import zsplit
 
 if sys.version_info >= (3, 11):  # pragma: >=3.11 cover
     from contextlib import chdir
@@ -44,12 +55,19 @@ def add_fixer_args(parser: argparse.ArgumentParser) -> None:
         '-i', '--interactive', action='store_true',
         help='interactively approve / deny fixes.',
     )
-    cli.add_jobs_arg(mutex, default=1)
+    cli.add_jobs_arg(parser, default=1)
 
     parser.add_argument(
         '--limit', type=int, default=None,
         help='maximum number of repos to process (default: unlimited).',
     )
+    parser.add_argument(
+        '--resume', action='store_true',
+        help=(
+            'skip repositories which a previous (interrupted) run of this '
+            'autofixer already completed.'
+        ),
+    )
     parser.add_argument(
         '--author',
         help=(
@@ -80,12 +98,14 @@ class AutofixSettings(NamedTuple):
     limit: int | None
     dry_run: bool
     interactive: bool
+    resume: bool = False
 
     @classmethod
     def from_cli(cls, args: Any) -> AutofixSettings:
         return cls(
             jobs=args.jobs, color=args.color, limit=args.limit,
             dry_run=args.dry_run, interactive=args.interactive,
+            resume=args.resume,
         )
 
 
@@ -151,22 +171,58 @@ def target_branch() -> str:
     return out[len('origin/'):]
 
 
+def _sparse_checkout(sparse_paths: Sequence[str]) -> None:
+    # non-cone patterns so individual files can be selected
+    run('git', 'config', 'core.sparseCheckout', 'true')
+    run('git', 'config', 'core.sparseCheckoutCone', 'false')
+    with open('.git/info/sparse-checkout', 'w') as f:
+        f.write(''.join(f'{path}\n' for path in sparse_paths))
+    run('git', 'read-tree', '-mu', 'HEAD')
+
+
 @contextlib.contextmanager
-def repo_context(repo: str, *, use_color: bool) -> Generator[None]:
+def _clone_context(
+        repo: str,
+        tmpdir: str,
+        *,
+        use_color: bool,
+        sparse_paths: Sequence[str] | None,
+) -> Generator[None]:
     print(color.fmt(f'***{repo}', color.TURQUOISE_H, use_color=use_color))
     try:
         remote = git.remote(repo)
-        with tempfile.TemporaryDirectory() as tmpdir:
-            run('git', 'clone', '--quiet', repo, tmpdir)
-            with chdir(tmpdir):
-                run('git', 'remote', 'set-url', 'origin', remote)
-                run('git', 'fetch', '--prune', '--quiet')
-                yield
+        # borrow the objects of the existing clone (via alternates)
+        # rather than copying them into the temporary directory
+        clone_cmd: tuple[str, ...]
+        clone_cmd = ('git', 'clone', '--quiet', '--shared')
+        if sparse_paths is not None:
+            clone_cmd += ('--no-checkout',)
+        run(*clone_cmd, repo, tmpdir)
+        with chdir(tmpdir):
+            if sparse_paths is not None:
+                _sparse_checkout(sparse_paths)
+            run('git', 'remote', 'set-url', 'origin', remote)
+            run('git', 'fetch', '--prune', '--quiet')
+            yield
     except Exception:
         print(color.fmt('***Errored', color.RED_H, use_color=use_color))
         traceback.print_exc()
 
 
+@contextlib.contextmanager
+def repo_context(
+        repo: str,
+        *,
+        use_color: bool,
+        sparse_paths: Sequence[str] | None = None,
+) -> Generator[None]:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with _clone_context(
+                repo, tmpdir, use_color=use_color, sparse_paths=sparse_paths,
+        ):
+            yield
+
+
 def shell() -> None:
     print('Opening an interactive shell, type `exit` to continue.')
     print('Any modifications will be committed.')
@@ -213,48 +269,361 @@ def _interactive_check(*, use_color: bool) -> bool:
             print('? (help): show this help message.')
 
 
-def _fix_inner(
+def _commit_cmd(commit: Commit, *args: str) -> tuple[str, ...]:
+    commit_message = (
+        f'{commit.msg}\n\n'
+        f'Committed via https://github.com/asottile/all-repos'
+    )
+    commit_cmd: tuple[str, ...] = (
+        'git', 'commit', '--quiet', *args, '-m', commit_message,
+    )
+    if commit.author:
+        commit_cmd += ('--author', commit.author)
+    return commit_cmd
+
+
+def _branch_name(commit: Commit) -> str:
+    return f'all-repos_autofix_{commit.branch_name}'
+
+
+# a repository is done once it reaches one of these (see `--resume`)
+_DONE = frozenset(('no-diff', 'pushed', 'rejected'))
+
+
+class _Prepared(NamedTuple):
+    repo: str
+    # `changed`, `no-diff`, `rejected` or `errored`
+    status: str
+    # `None` when there is nothing to commit / push
+    tmpdir: str | None
+    output: str
+
+
+class _Pushed(NamedTuple):
+    repo: str
+    # `pushed` or `errored`
+    status: str
+    url: str | None
+
+
+@contextlib.contextmanager
+def _captured_output() -> Generator[IO[bytes]]:
+    # output of repositories prepared ahead of review is replayed later
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(fd) for fd in (1, 2)]
+    with tempfile.TemporaryFile() as f:
+        for fd in (1, 2):
+            os.dup2(f.fileno(), fd)
+        try:
+            yield f
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            for fd, saved_fd in zip((1, 2), saved):
+                os.dup2(saved_fd, fd)
+                os.close(saved_fd)
+
+
+def _prepare(
         repo: str,
-        apply_fix: Callable[[], None],
-        check_fix: Callable[[], None],
+        *,
+        fix_repo: Callable[[], bool],
+        autofix_settings: AutofixSettings,
+        sparse_paths: Sequence[str] | None,
+        workdir: str,
+) -> _Prepared:
+    # the temporary clone outlives this call when there is something to
+    # review / push, it is removed by `_review` / `_push_inner`
+    tmpdir = tempfile.mkdtemp(dir=workdir)
+    with contextlib.ExitStack() as ctx:
+        if autofix_settings.interactive and autofix_settings.jobs > 1:
+            output = ctx.enter_context(_captured_output())
+        else:
+            output = None
+
+        status = 'errored'  # unless the fix runs to completion
+        with _clone_context(
+                repo, tmpdir,
+                use_color=autofix_settings.color, sparse_paths=sparse_paths,
+        ):
+            status = 'changed' if fix_repo() else 'no-diff'
+
+        if output is None:
+            output_s = ''
+        else:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            output.seek(0)
+            output_s = output.read().decode(errors='replace')
+
+    if status == 'changed' and not autofix_settings.dry_run:
+        return _Prepared(repo, status, tmpdir, output_s)
+    else:
+        shutil.rmtree(tmpdir)
+        return _Prepared(repo, status, None, output_s)
+
+
+def _review(
+        prepared: _Prepared,
+        commit: Commit,
+        autofix_settings: AutofixSettings,
+) -> _Prepared:
+    print(prepared.output, end='')
+    if prepared.tmpdir is None:
+        return prepared
+
+    try:
+        with chdir(prepared.tmpdir):
+            if _interactive_check(use_color=autofix_settings.color):
+                run(*_commit_cmd(commit, '-a'))
+                return prepared
+            else:
+                status = 'rejected'
+    except Exception:
+        print(
+            color.fmt(
+                '***Errored', color.RED_H, use_color=autofix_settings.color,
+            ),
+        )
+        traceback.print_exc()
+        status = 'errored'
+
+    shutil.rmtree(prepared.tmpdir)
+    return prepared._replace(status=status, tmpdir=None)
+
+
+def _push_inner(
+        prepared: _Prepared,
         config: Config,
         commit: Commit,
         autofix_settings: AutofixSettings,
-) -> None:
-    with repo_context(repo, use_color=autofix_settings.color):
-        branch_name = f'all-repos_autofix_{commit.branch_name}'
-        run('git', 'checkout', '--quiet', 'origin/HEAD', '-b', branch_name)
+) -> _Pushed:
+    assert prepared.tmpdir is not None
+    try:
+        with chdir(prepared.tmpdir):
+            url = config.push(config.push_settings, _branch_name(commit))
+    except Exception:
+        print(
+            color.fmt(
+                f'***Errored pushing {prepared.repo}',
+                color.RED_H, use_color=autofix_settings.color,
+            ),
+        )
+        traceback.print_exc()
+        return _Pushed(prepared.repo, 'errored', None)
+    else:
+        return _Pushed(prepared.repo, 'pushed', url)
+    finally:
+        shutil.rmtree(prepared.tmpdir)
 
-        apply_fix()
 
-        diff = run('git', 'diff', 'origin/HEAD', '--exit-code', check=False)
-        if not diff.returncode:
-            return
+def _journal_path(config: Config, commit: Commit) -> str:
+    filename = urllib.parse.quote(commit.branch_name, safe='')
+    return os.path.join(config.autofix_journal_dir, f'{filename}.jsonl')
 
-        check_fix()
 
-        if (
-                autofix_settings.interactive and
-                not _interactive_check(use_color=autofix_settings.color)
-        ):
-            return
+def _done_repos(path: str) -> set[str]:
+    statuses = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:  # a partial line from an interrupted run
+                    continue
+                statuses[entry['repo']] = entry['status']
+    except FileNotFoundError:
+        pass
+    return {repo for repo, status in statuses.items() if status in _DONE}
+
+
+def _record(
+        journal: IO[str] | None,
+        repo: str,
+        status: str,
+        url: str | None = None,
+) -> None:
+    if journal is not None:
+        entry = {'repo': repo, 'status': status, 'url': url}
+        journal.write(f'{json.dumps(entry)}\n')
+        journal.flush()
 
-        commit_message = (
-            f'{commit.msg}\n\n'
-            f'Committed via https://github.com/asottile/all-repos'
-        )
-        commit_cmd: tuple[str, ...] = (
-            'git', 'commit', '--quiet', '-a', '-m', commit_message,
+
+def _ends_in_partial_line(path: str) -> bool:
+    try:
+        with open(path, 'rb') as f:
+            if not f.seek(0, os.SEEK_END):
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read() != b'\n'
+    except FileNotFoundError:
+        return False
+
+
+def _push_all(
+        push_ex: concurrent.futures.Executor,
+        push: Callable[[_Prepared], _Pushed],
+        prepared: Iterable[_Prepared],
+        record: Callable[[str, str, str | None], None],
+        *,
+        jobs: int,
+) -> None:
+    def _record_pushed(fut: concurrent.futures.Future[_Pushed]) -> None:
+        # each push is recorded as soon as it finishes (on the pool's thread)
+        # so an interrupted run does not forget the pull requests it made
+        if fut.exception() is None:
+            record(*fut.result())
+
+    def _wait(
+            futures: set[concurrent.futures.Future[_Pushed]],
+            *,
+            timeout: float | None = None,
+            return_when: str = concurrent.futures.ALL_COMPLETED,
+    ) -> set[concurrent.futures.Future[_Pushed]]:
+        done, not_done = concurrent.futures.wait(
+            futures, timeout=timeout, return_when=return_when,
         )
-        if commit.author:
-            commit_cmd += ('--author', commit.author)
+        for fut in done:
+            fut.result()  # re-raise unexpected errors
+        return not_done
+
+    pending: set[concurrent.futures.Future[_Pushed]] = set()
+    for item in prepared:
+        pending = _wait(pending, timeout=0)
+        # bound the prepared clones which are waiting to be pushed
+        if len(pending) >= jobs * 4:
+            pending = _wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+        fut = push_ex.submit(push, item)
+        fut.add_done_callback(_record_pushed)
+        pending.add(fut)
+    _wait(pending)
+
 
-        run(*commit_cmd)
+def _pipeline(
+        repos: Iterable[str],
+        prepare: Callable[..., _Prepared],
+        *,
+        config: Config,
+        commit: Commit,
+        autofix_settings: AutofixSettings,
+) -> None:
+    journal_path = _journal_path(config, commit)
+    if autofix_settings.resume:
+        done = _done_repos(journal_path)
+        repos = (repo for repo in repos if repo not in done)
+    # discovery (`repos`), fixing and pushing overlap: each stage has its own
+    # pool so slow pushes do not hold a slot which could be fixing
+    repos = itertools.islice(repos, autofix_settings.limit)
+    push = functools.partial(
+        _push_inner,
+        config=config, commit=commit, autofix_settings=autofix_settings,
+    )
+    jobs = autofix_settings.jobs
 
+    with contextlib.ExitStack() as ctx:
+        # the journal is only written here (not by the workers)
+        journal: IO[str] | None
         if autofix_settings.dry_run:
-            return
+            journal = None
+        else:
+            os.makedirs(config.autofix_journal_dir, exist_ok=True)
+            if autofix_settings.resume:
+                # terminate a partial entry left behind by an interrupted run
+                partial = _ends_in_partial_line(journal_path)
+                journal = ctx.enter_context(open(journal_path, 'a'))
+                if partial:
+                    journal.write('\n')
+            else:
+                journal = ctx.enter_context(open(journal_path, 'w'))
+
+        # pushes finish on the pool's thread while the main thread records
+        # the repositories which are not pushed
+        journal_lock = threading.Lock()
+
+        def _record_locked(repo: str, status: str, url: str | None) -> None:
+            with journal_lock:
+                _record(journal, repo, status, url)
+
+        # anything left behind (for instance after quitting a review) is
+        # removed once the pools have finished
+        workdir = ctx.enter_context(
+            tempfile.TemporaryDirectory(prefix='all-repos-'),
+        )
+        prepare = functools.partial(prepare, workdir=workdir)
+        prepare_map = ctx.enter_context(mapper.bounded_process_mapper(jobs))
+
+        def _to_push() -> Generator[_Prepared]:
+            for prepared in prepare_map(prepare, repos):
+                if autofix_settings.interactive:
+                    # repositories are prepared ahead while the user reviews
+                    prepared = _review(prepared, commit, autofix_settings)
+                if prepared.tmpdir is None:
+                    _record_locked(prepared.repo, prepared.status, None)
+                else:
+                    yield prepared
+
+        if jobs == 1:
+            for prepared in _to_push():
+                _record_locked(*push(prepared))
+        else:
+            # pull requests are created from every worker, pace them together
+            push_ex = ctx.enter_context(
+                mapper.cancel_on_error(
+                    mapper.process_executor(
+                        jobs,
+                        initializer=http_pool.use_mutating_clock,
+                        initargs=(http_pool.mutating_clock(),),
+                    ),
+                ),
+            )
+            _push_all(push_ex, push, _to_push(), _record_locked, jobs=jobs)
 
-        config.push(config.push_settings, branch_name)
+
+def _fix_repo(
+        apply_fix: Callable[[], None],
+        check_fix: Callable[[], None],
+        commit: Commit,
+        autofix_settings: AutofixSettings,
+) -> bool:
+    branch_name = _branch_name(commit)
+    run('git', 'checkout', '--quiet', 'origin/HEAD', '-b', branch_name)
+
+    apply_fix()
+
+    diff = run('git', 'diff', 'origin/HEAD', '--exit-code', check=False)
+    if not diff.returncode:
+        return False
+
+    check_fix()
+
+    # interactive fixes are committed once they are approved
+    if not autofix_settings.interactive:
+        run(*_commit_cmd(commit, '-a'))
+    return True
+
+
+def _fix_inner(
+        repo: str,
+        apply_fix: Callable[[], None],
+        check_fix: Callable[[], None],
+        commit: Commit,
+        autofix_settings: AutofixSettings,
+        sparse_paths: Sequence[str] | None,
+        workdir: str,
+) -> _Prepared:
+    fix_repo = functools.partial(
+        _fix_repo, apply_fix, check_fix, commit, autofix_settings,
+    )
+    return _prepare(
+        repo,
+        fix_repo=fix_repo,
+        autofix_settings=autofix_settings,
+        sparse_paths=sparse_paths,
+        workdir=workdir,
+    )
 
 
 def _noop_check_fix() -> None:
@@ -269,13 +638,168 @@ def fix(
         config: Config,
         commit: Commit,
         autofix_settings: AutofixSettings,
+        sparse_paths: Sequence[str] | None = None,
 ) -> None:
-    assert not autofix_settings.interactive or autofix_settings.jobs == 1
-    repos = tuple(repos)[:autofix_settings.limit]
     func = functools.partial(
         _fix_inner,
         apply_fix=apply_fix, check_fix=check_fix,
+        commit=commit, autofix_settings=autofix_settings,
+        sparse_paths=sparse_paths,
+    )
+    _pipeline(
+        repos, func,
+        config=config, commit=commit, autofix_settings=autofix_settings,
+    )
+
+
+def _ls_files(pathspecs: Sequence[str]) -> list[tuple[str, str, bytes]]:
+    out = subprocess.check_output((
+        'git', 'ls-files', '-z', '--stage', '--', *pathspecs,
+    ))
+    ret = []
+    for entry in zsplit(out):
+        info, _, filename = entry.partition(b'\t')
+        mode, sha, _ = info.decode().split()
+        if mode in {'100644', '100755'}:  # not symlinks / submodules
+            ret.append((mode, sha, filename))
+    return ret
+
+
+def _apply_edit(
+        *,
+        pathspecs: Sequence[str],
+        edit_files: Callable[[list[str]], None],
+) -> None:
+    filenames = [os.fsdecode(f) for _, _, f in _ls_files(pathspecs)]
+    if filenames:
+        edit_files(filenames)
+
+
+def _c_quote(path: bytes) -> bytes:
+    # `git hash-object --stdin-paths` unquotes c-style quoted paths
+    for c, escaped in ((b'\\', b'\\\\'), (b'"', b'\\"'), (b'\n', b'\\n')):
+        path = path.replace(c, escaped)
+    return b'"' + path + b'"'
+
+
+def _edit_index(
+        pathspecs: Sequence[str],
+        edit_files: Callable[[list[str]], None],
+) -> list[bytes]:
+    files = _ls_files(pathspecs)
+    if not files:
+        return []
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # the matching blobs are written under their own names to a scratch
+        # directory rather than checked out into the repository
+        paths = [os.path.join(os.fsencode(scratch), f) for _, _, f in files]
+        with cat_file.batch('.') as batch:
+            for (_, sha, _), path in zip(files, paths):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(batch.read(sha))
+
+        with chdir(scratch):
+            edit_files([os.fsdecode(f) for _, _, f in files])
+
+        # one `git` for all of the files, unchanged blobs hash the same (as
+        # long as `core.autocrlf` / attributes do not convert them)
+        out = subprocess.run(
+            ('git', 'hash-object', '-w', '--no-filters', '--stdin-paths'),
+            input=b''.join(_c_quote(path) + b'\n' for path in paths),
+            stdout=subprocess.PIPE, check=True,
+        ).stdout
+    new_shas = out.decode().split()
+
+    changed = []
+    index_info = []
+    for (mode, sha, filename), new_sha in zip(files, new_shas):
+        if new_sha != sha:
+            changed.append(filename)
+            entry = f'{mode} {new_sha}\t'.encode() + filename + b'\0'
+            index_info.append(entry)
+
+    if changed:
+        subprocess.run(
+            ('git', 'update-index', '-z', '--index-info'),
+            input=b''.join(index_info), check=True,
+        )
+    return changed
+
+
+def _fix_contents_repo(
+        pathspecs: Sequence[str],
+        edit_files: Callable[[list[str]], None],
+        commit: Commit,
+) -> bool:
+    branch_name = _branch_name(commit)
+    run('git', 'checkout', '--quiet', 'origin/HEAD', '-b', branch_name)
+
+    changed = _edit_index(pathspecs, edit_files)
+    if not changed:
+        return False
+
+    run('git', 'diff', '--cached', 'origin/HEAD')
+    run(*_commit_cmd(commit))
+    # the updated entries are not in the working directory either
+    subprocess.run(
+        ('git', 'update-index', '-z', '--skip-worktree', '--stdin'),
+        input=b''.join(f + b'\0' for f in changed), check=True,
+    )
+    return True
+
+
+def _fix_contents_inner(
+        repo: str,
+        pathspecs: Sequence[str],
+        edit_files: Callable[[list[str]], None],
+        commit: Commit,
+        autofix_settings: AutofixSettings,
+        workdir: str,
+) -> _Prepared:
+    fix_repo = functools.partial(
+        _fix_contents_repo, pathspecs, edit_files, commit,
+    )
+    # an empty sparse checkout: nothing is written to the working directory
+    return _prepare(
+        repo,
+        fix_repo=fix_repo,
+        autofix_settings=autofix_settings,
+        sparse_paths=(),
+        workdir=workdir,
+    )
+
+
+def fix_contents(
+        repos: Iterable[str],
+        *,
+        pathspecs: Sequence[str],
+        edit_files: Callable[[list[str]], None],
+        config: Config,
+        commit: Commit,
+        autofix_settings: AutofixSettings,
+) -> None:
+    if autofix_settings.interactive:
+        # the interactive shell needs a working directory
+        apply_fix = functools.partial(
+            _apply_edit, pathspecs=pathspecs, edit_files=edit_files,
+        )
+        fix(
+            repos,
+            apply_fix=apply_fix,
+            config=config,
+            commit=commit,
+            autofix_settings=autofix_settings,
+        )
+        return
+
+    func = functools.partial(
+        _fix_contents_inner,
+        pathspecs=pathspecs, edit_files=edit_files,
+        commit=commit, autofix_settings=autofix_settings,
+    )
+    _pipeline(
+        repos, func,
         config=config, commit=commit, autofix_settings=autofix_settings,
     )
-    with mapper.process_mapper(autofix_settings.jobs) as do_map:
-        mapper.exhaust(do_map(func, repos))
@@ -5,6 +5,8 @@ import urllib.request
 from typing import Any
 from typing import NamedTuple
 
+from all_repos import http_pool
+
 
 class Response(NamedTuple):
     values: Any
@@ -12,7 +14,7 @@ class Response(NamedTuple):
 
 
 def req(url: str, **kwargs: Any) -> Response:
-    resp = urllib.request.urlopen(urllib.request.Request(url, **kwargs))
+    resp = http_pool.urlopen(urllib.request.Request(url, **kwargs))
     obj = json.load(resp)
     return Response(obj['values'], obj.get('next'))
 
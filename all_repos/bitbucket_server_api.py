@@ -5,6 +5,8 @@ import urllib.request
 from typing import Any
 from typing import NamedTuple
 
+from all_repos import http_pool
+
 
 class Response(NamedTuple):
     values: Any
@@ -13,7 +15,7 @@ class Response(NamedTuple):
 
 
 def req(url: str, **kwargs: Any) -> Response:
-    resp = urllib.request.urlopen(urllib.request.Request(url, **kwargs))
+    resp = http_pool.urlopen(urllib.request.Request(url, **kwargs))
     obj = json.load(resp)
     next_index = None
     if obj.get('nextPageStart') is not None and not obj['isLastPage']:
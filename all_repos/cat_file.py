@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import contextlib
+import subprocess
+from collections.abc import Generator
+from typing import IO
+from typing import NamedTuple
+
+_TYPES = {'40000': 'tree', '160000': 'commit'}
+
+
+class TreeEntry(NamedTuple):
+    mode: str
+    type: str
+    sha: str
+    name: bytes
+
+
+def _parse_tree(contents: bytes, sha_len: int) -> list[TreeEntry]:
+    ret = []
+    pos = 0
+    while pos < len(contents):
+        space = contents.index(b' ', pos)
+        nul = contents.index(b'\0', space)
+        mode = contents[pos:space].decode()
+        sha = contents[nul + 1:nul + 1 + sha_len].hex()
+        tp = _TYPES.get(mode, 'blob')
+        # match the modes `git ls-tree` prints
+        ret.append(TreeEntry(mode.zfill(6), tp, sha, contents[space + 1:nul]))
+        pos = nul + 1 + sha_len
+    return ret
+
+
+class Batch(NamedTuple):
+    stdin: IO[bytes]
+    stdout: IO[bytes]
+
+    def _read(self, obj: str) -> tuple[str, str, bytes] | None:
+        # the protocol is line based
+        if '\n' in obj:
+            raise ValueError(f'unexpected newline in object name: {obj!r}')
+
+        self.stdin.write(f'{obj}\n'.encode())
+        self.stdin.flush()
+        header = self.stdout.readline()
+        if not header:
+            raise OSError('`git cat-file --batch` exited unexpectedly')
+        elif header.endswith((b' missing\n', b' ambiguous\n')):
+            return None
+
+        sha, tp, size = header.decode().split()
+        contents = self.stdout.read(int(size))
+        self.stdout.read(1)  # trailing newline
+        return sha, tp, contents
+
+    def read(self, obj: str) -> bytes:
+        ret = self._read(obj)
+        if ret is None:
+            raise KeyError(obj)
+        else:
+            _, _, contents = ret
+            return contents
+
+    def read_blob(self, path: str, *, rev: str = 'HEAD') -> bytes | None:
+        # `None` when there is no such file
+        ret = self._read(f'{rev}:{path}')
+        if ret is None or ret[1] != 'blob':
+            return None
+        else:
+            _, _, contents = ret
+            return contents
+
+    def ls_tree(
+            self,
+            path: str = '',
+            *,
+            rev: str = 'HEAD',
+    ) -> list[TreeEntry] | None:
+        # `None` when there is no such directory
+        ret = self._read(f'{rev}:{path}')
+        if ret is None or ret[1] != 'tree':
+            return None
+        else:
+            sha, _, contents = ret
+            return _parse_tree(contents, len(sha) // 2)
+
+
+@contextlib.contextmanager
+def batch(path: str) -> Generator[Batch]:
+    # a single `git cat-file` process answers every request for the repository
+    with subprocess.Popen(
+            ('git', '-C', path, 'cat-file', '--batch'),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+    ) as proc:
+        assert proc.stdin is not None and proc.stdout is not None
+        yield Batch(proc.stdin, proc.stdout)
@@ -1,23 +1,34 @@
 from __future__ import annotations
 
 import argparse
+import concurrent.futures
 import functools
+import hashlib
 import json
 import os.path
 import shutil
 import subprocess
+import tempfile
+import time
 from collections.abc import Generator
 from collections.abc import Sequence
+from typing import NamedTuple
 
 from all_repos import cli
+from all_repos import find_files
 from all_repos import git
+from all_repos import http_pool
+from all_repos import index
 from all_repos import mapper
+from all_repos.config import Config
 from all_repos.config import load_config
+from all_repos.repo_metadata import RepoMetadata
 
+# tolerate this much clock difference between us and the source's servers
+PUSHED_AT_SLACK = 5 * 60
 
-def _get_current_state_helper(
-        path: str,
-) -> Generator[tuple[str, str]]:
+
+def _get_current_state_helper(path: str, *, trash: str) -> Generator[str]:
     if not os.path.exists(path):
         return
 
@@ -26,32 +37,99 @@ def _get_current_state_helper(
     for direntry in os.scandir(path):
         if direntry.name == '.git':
             seen_git = True
+        elif os.path.abspath(direntry.path) == trash:
+            continue
         elif direntry.is_dir():  # pragma: no branch (defensive)
             pths.append(direntry)
     if seen_git:
-        yield path, git.remote(path)
+        yield path
     else:
         for pth in pths:
-            yield from _get_current_state_helper(os.fspath(pth))
+            yield from _get_current_state_helper(os.fspath(pth), trash=trash)
 
 
-def _get_current_state(path: str) -> dict[str, str]:
-    return {
-        os.path.relpath(k, path): v for k, v in _get_current_state_helper(path)
-    }
+def _get_current_state(config: Config, *, jobs: int) -> dict[str, str]:
+    # `repos_filtered.json` is only written once a run completes: the
+    # repositories on disk are the ones it lists, which avoids walking
+    # `output_dir` (and every checkout's top level directory)
+    if os.path.exists(config.repos_filtered_path):
+        paths = [
+            path
+            for path in (
+                os.path.join(config.output_dir, repo)
+                for repo in config.get_cloned_repos()
+            )
+            if os.path.exists(os.path.join(path, '.git'))
+        ]
+    else:
+        paths = list(
+            _get_current_state_helper(
+                config.output_dir, trash=config.trash_path,
+            ),
+        )
 
+    with mapper.thread_mapper(jobs) as do_map:
+        return {
+            os.path.relpath(path, config.output_dir): remote
+            for path, remote in zip(paths, do_map(git.remote, paths))
+        }
 
-def _remove(dest: str, path: str) -> None:
-    print(f'Removing {path}')
-    shutil.rmtree(os.path.join(dest, path))
-    # Remove any empty directories
-    path = os.path.dirname(path)
+
+def _remove_empty_dirs(dest: str, path: str) -> None:
     while path and not os.listdir(os.path.join(dest, path)):
         os.rmdir(os.path.join(dest, path))
         path = os.path.dirname(path)
 
 
-def _init(dest: str, path: str, remote: str) -> None:
+def _remove(dest: str, path: str, *, trash: str) -> None:
+    print(f'Removing {path}')
+    # moved out of the way atomically, the trash is emptied in the background
+    os.makedirs(trash, exist_ok=True)
+    trash_dir = tempfile.mkdtemp(dir=trash)
+    try:
+        os.rename(os.path.join(dest, path), os.path.join(trash_dir, 'repo'))
+    except OSError:  # for example: a different filesystem
+        shutil.rmtree(os.path.join(dest, path))
+    # Remove any empty directories
+    _remove_empty_dirs(dest, os.path.dirname(path))
+
+
+def _empty_trash(trash: str) -> None:
+    if not os.path.exists(trash):
+        return
+    # includes anything left behind by an interrupted run
+    for name in os.listdir(trash):
+        shutil.rmtree(os.path.join(trash, name))
+    os.rmdir(trash)
+
+
+def _set_url(dest: str, path: str, remote: str) -> None:
+    subprocess.check_output((
+        'git', '-C', os.path.join(dest, path),
+        'remote', 'set-url', 'origin', remote,
+    ))
+
+
+def _move(dest: str, src: str, path: str, remote: str) -> None:
+    print(f'Moving {src} to {path}')
+    os.makedirs(os.path.dirname(os.path.join(dest, path)), exist_ok=True)
+    os.rename(os.path.join(dest, src), os.path.join(dest, path))
+    _remove_empty_dirs(dest, os.path.dirname(src))
+    _set_url(dest, path, remote)
+
+
+def _update_remote(dest: str, path: str, remote: str) -> None:
+    print(f'Updating remote of {path}')
+    _set_url(dest, path, remote)
+
+
+def _init(
+        dest: str,
+        path: str,
+        remote: str,
+        *,
+        clone_filter: str | None,
+) -> None:
     print(f'Initializing {path}')
     path = os.path.join(dest, path)
     os.makedirs(path, exist_ok=True)
@@ -59,23 +137,164 @@ def _init(dest: str, path: str, remote: str) -> None:
     subprocess.check_output((
         'git', '-C', path, 'remote', 'add', 'origin', remote,
     ))
+    if clone_filter is not None:
+        # what `git clone --filter=...` sets up: a promisor remote, later
+        # fetches (and lazily fetched objects) use the same filter
+        for k, v in (
+                ('remote.origin.promisor', 'true'),
+                ('remote.origin.partialclonefilter', clone_filter),
+        ):
+            subprocess.check_call(('git', '-C', path, 'config', k, v))
+
+
+def _ls_remote(remote: str, *, all_branches: bool) -> str:
+    cmd: tuple[str, ...] = (
+        'git', 'ls-remote', '--exit-code', '--symref', remote, 'HEAD',
+    )
+    if all_branches:
+        cmd += ('refs/heads/*',)
+    return subprocess.check_output(cmd, encoding='UTF-8')
 
 
-def _default_branch(remote: str) -> str:
-    cmd = ('git', 'ls-remote', '--exit-code', '--symref', remote, 'HEAD')
-    out = subprocess.check_output(cmd, encoding='UTF-8')
-    line = out.splitlines()[0]
+def _default_branch(ls_remote_out: str) -> str:
+    line = ls_remote_out.splitlines()[0]
     start, end = 'ref: refs/heads/', '\tHEAD'
     assert line.startswith(start) and line.endswith(end), line
     return line[len(start):-1 * len(end)]
 
 
-def _fetch_reset(path: str, *, all_branches: bool) -> None:
+class RepoState(NamedTuple):
+    all_branches: bool
+    # digest of the `git ls-remote` output (when it was used)
+    ls_remote: str | None
+    # unix timestamp of the start of the last successful fetch
+    fetched_at: float
+    # the source's id for the repository (see `RepoMetadata`)
+    repo_id: str | None = None
+
+
+def _local_head(path: str) -> str | None:
+    try:
+        out = subprocess.check_output((
+            'git', '-C', path, 'rev-parse', '--verify', '--quiet', 'HEAD',
+        ))
+    except subprocess.CalledProcessError:  # no commits
+        return None
+    else:
+        return out.decode().strip()
+
+
+def _remote_head(remote: str) -> str | None:
+    try:
+        out = subprocess.check_output(('git', 'ls-remote', remote, 'HEAD'))
+    except subprocess.CalledProcessError:
+        return None
+    else:
+        return out.decode().split('\t', 1)[0] or None
+
+
+def _find_moves(
+        dest: str,
+        removed: dict[str, str],
+        added: dict[str, str],
+        *,
+        state: dict[str, RepoState],
+        metadata: dict[str, RepoMetadata],
+        jobs: int,
+) -> dict[str, str]:
+    # renamed / transferred repositories: new path => old path
+    sources = set(removed)
+    targets = [
+        path for path in added
+        if (
+            not os.path.exists(os.path.join(dest, path)) and
+            not any(path.startswith(f'{src}/') for src in sources)
+        )
+    ]
+    moves: dict[str, str] = {}
+
+    by_id = {}
+    for path in sources:
+        if path in state and state[path].repo_id is not None:
+            by_id[state[path].repo_id] = path
+    for path in targets:
+        meta = metadata.get(path)
+        if meta is not None and meta.repo_id in by_id:
+            moves[path] = by_id.pop(meta.repo_id)
+
+    # without an id fall back to matching the checked out commit
+    sources = {
+        path for path in sources
+        if path not in moves.values() and (
+            path not in state or state[path].repo_id is None
+        )
+    }
+    targets = [path for path in targets if path not in moves]
+    if not sources or not targets:
+        return moves
+
+    srcs = sorted(sources)
+    src_paths = [os.path.join(dest, src) for src in srcs]
+    with mapper.thread_mapper(jobs) as do_map:
+        by_head = {
+            head: src
+            for src, head in zip(srcs, do_map(_local_head, src_paths))
+            if head is not None
+        }
+        remote_heads = do_map(_remote_head, [added[p] for p in targets])
+        for path, head in zip(targets, remote_heads):
+            if head is not None and head in by_head:
+                moves[path] = by_head.pop(head)
+    return moves
+
+
+def _fetch_reset(
+        dest: str,
+        repo: str,
+        *,
+        all_branches: bool,
+        depth: int | None,
+        state: dict[str, RepoState],
+        metadata: dict[str, RepoMetadata],
+) -> RepoState | None:
+    path = os.path.join(dest, repo)
+    start = time.time()
+    prev = state.get(repo)
+    if prev is not None and prev.all_branches != all_branches:
+        prev = None
+    meta = metadata.get(repo)
+    repo_id = meta.repo_id if meta is not None else None
+
+    # nothing has been pushed since we last fetched
+    if (
+            prev is not None and
+            meta is not None and
+            meta.pushed_at is not None and
+            meta.pushed_at < prev.fetched_at - PUSHED_AT_SLACK
+    ):
+        return prev._replace(repo_id=repo_id)
+
     def _git(*cmd: str) -> None:
         subprocess.check_call(('git', '-C', path, *cmd))
 
     try:
-        branch = _default_branch(git.remote(path))
+        # without `pushed_at` the `ls-remote` digest is the only way to know
+        # whether anything changed, so only skip it when that is known
+        if (
+                meta is not None and
+                meta.pushed_at is not None and
+                meta.default_branch is not None
+        ):
+            ls_remote = None
+            branch = meta.default_branch
+        else:
+            out = _ls_remote(git.remote(path), all_branches=all_branches)
+            ls_remote = hashlib.sha256(out.encode()).hexdigest()
+            # nothing has moved upstream since we last fetched
+            if prev is not None and prev.ls_remote == ls_remote:
+                return RepoState(all_branches, ls_remote, start, repo_id)
+            branch = _default_branch(out)
+
         if all_branches:
             _git(
                 'config', 'remote.origin.fetch',
@@ -83,12 +302,35 @@ def _fetch_reset(path: str, *, all_branches: bool) -> None:
             )
         else:
             _git('remote', 'set-branches', 'origin', branch)
-        _git('fetch', 'origin')
+        if depth is not None:
+            # history stays truncated at `depth` commits on every fetch
+            _git('fetch', f'--depth={depth}', 'origin')
+        else:
+            _git('fetch', 'origin')
         _git('checkout', branch)
         _git('reset', '--hard', f'origin/{branch}')
     except subprocess.CalledProcessError:
         # TODO: color / tty
         print(f'Error fetching {path}')
+        return None
+    else:
+        return RepoState(all_branches, ls_remote, start, repo_id)
+
+
+def _load_state(path: str) -> dict[str, RepoState]:
+    if os.path.exists(path):
+        with open(path) as f:
+            return {k: RepoState(**v) for k, v in json.load(f).items()}
+    else:
+        return {}
+
+
+def _list_repos(config: Config) -> dict[str, RepoMetadata]:
+    if config.list_repos_metadata is not None:
+        return config.list_repos_metadata(config.source_settings)
+    else:
+        repos = config.list_repos(config.source_settings)
+        return {k: RepoMetadata(remote=v) for k, v in repos.items()}
 
 
 def main(argv: Sequence[str] | None = None) -> int:
@@ -105,32 +347,77 @@ def main(argv: Sequence[str] | None = None) -> int:
 
     config = load_config(args.config_filename)
 
-    repos = config.list_repos(config.source_settings)
+    with http_pool.cache(config.http_cache_path):
+        metadata = _list_repos(config)
+    repos = {k: v.remote for k, v in metadata.items()}
     repos_filtered = {
         k: v for k, v in sorted(repos.items())
         if config.include.search(k) and not config.exclude.search(k)
     }
 
-    # If the previous `repos.json` / `repos_filtered.json` files exist
-    # remove them.
-    for path in (config.repos_path, config.repos_filtered_path):
+    state = _load_state(config.clone_state_path)
+    current_repos = set(_get_current_state(config, jobs=args.jobs).items())
+
+    # If the previous `repos.json` / `repos_filtered.json` / state files
+    # exist remove them.
+    for path in (
+            config.repos_path,
+            config.repos_filtered_path,
+            config.clone_state_path,
+    ):
         if os.path.exists(path):
             os.remove(path)
 
-    current_repos = set(_get_current_state(config.output_dir).items())
     filtered_repos = set(repos_filtered.items())
 
-    # Remove old no longer cloned repositories
-    for path, _ in current_repos - filtered_repos:
-        _remove(config.output_dir, path)
+    removed = dict(current_repos - filtered_repos)
+    added = dict(filtered_repos - current_repos)
+    # only the url changed (https => ssh, a new host, etc.)
+    for path in sorted(removed.keys() & added.keys()):
+        state.pop(path, None)
+        _update_remote(config.output_dir, path, added.pop(path))
+        del removed[path]
+
+    moves = _find_moves(
+        config.output_dir, removed, added,
+        state=state, metadata=metadata, jobs=args.jobs,
+    )
+
+    with concurrent.futures.ThreadPoolExecutor(1) as trash_ex:
+        # Remove old no longer cloned repositories
+        for path in sorted(removed.keys() - moves.values()):
+            state.pop(path, None)
+            _remove(config.output_dir, path, trash=config.trash_path)
+        # deleting the removed repositories overlaps with fetching
+        emptied = trash_ex.submit(_empty_trash, config.trash_path)
+
+        # the existing clone is reused and updated by the fetch below
+        for path, src in sorted(moves.items()):
+            state.pop(src, None)
+            state.pop(path, None)
+            _move(config.output_dir, src, path, added[path])
 
-    for path, remote in filtered_repos - current_repos:
-        _init(config.output_dir, path, remote)
+        for path in sorted(added.keys() - moves.keys()):
+            state.pop(path, None)
+            _init(
+                config.output_dir, path, added[path],
+                clone_filter=config.clone_filter,
+            )
 
-    fn = functools.partial(_fetch_reset, all_branches=config.all_branches)
-    todo = [os.path.join(config.output_dir, p) for p in repos_filtered]
-    with mapper.thread_mapper(args.jobs) as do_map:
-        mapper.exhaust(do_map(fn, todo))
+        fn = functools.partial(
+            _fetch_reset, config.output_dir,
+            all_branches=config.all_branches, depth=config.depth,
+            state=state, metadata=metadata,
+        )
+        with mapper.thread_mapper(args.jobs) as do_map:
+            new_state = {
+                repo: repo_state
+                for repo, repo_state in zip(
+                    repos_filtered, do_map(fn, repos_filtered),
+                )
+                if repo_state is not None
+            }
+    emptied.result()
 
     # write these last
     os.makedirs(config.output_dir, exist_ok=True)
@@ -138,7 +425,14 @@ def main(argv: Sequence[str] | None = None) -> int:
         f.write(json.dumps(repos))
     with open(config.repos_filtered_path, 'w') as f:
         f.write(json.dumps(repos_filtered))
+    with open(config.clone_state_path, 'w') as f:
+        f.write(json.dumps({k: v._asdict() for k, v in new_state.items()}))
     open(os.path.join(config.output_dir, '.all-repos'), 'w').close()
+
+    find_files.update_catalog(config, repos_filtered, jobs=args.jobs)
+    # only maintain the index if it has been opted into via `all-repos-index`
+    if os.path.exists(config.index_path):
+        index.update(config, repos_filtered, jobs=args.jobs)
     return 0
 
 
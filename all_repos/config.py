@@ -9,7 +9,14 @@ from re import Pattern
 from typing import Any
 from typing import NamedTuple
 
+from all_repos.repo_metadata import RepoMetadata
+
 REPOS_JSON_FILES = frozenset(('repos.json', 'repos_filtered.json'))
+STATE_FILES = frozenset((
+    '.all-repos-clone-state.json',
+    '.all-repos-files',
+    '.all-repos-index.db',
+))
 
 
 class Config(NamedTuple):
@@ -17,10 +24,15 @@ class Config(NamedTuple):
     include: Pattern[str]
     exclude: Pattern[str]
     list_repos: Callable[[Any], dict[str, str]]
+    list_repos_metadata: Callable[[Any], dict[str, RepoMetadata]] | None
     source_settings: Any
-    push: Callable[[Any, str], None]
+    push: Callable[[Any, str], str | None]
     push_settings: Any
     all_branches: bool
+    # `git fetch --filter=...` (a partial clone), for instance `blob:none`
+    clone_filter: str | None = None
+    # `git fetch --depth=...` (a shallow clone)
+    depth: int | None = None
 
     def _path(self, *paths: str) -> str:
         return os.path.abspath(os.path.join(self.output_dir, *paths))
@@ -33,6 +45,30 @@ class Config(NamedTuple):
     def repos_filtered_path(self) -> str:
         return self._path('repos_filtered.json')
 
+    @property
+    def clone_state_path(self) -> str:
+        return self._path('.all-repos-clone-state.json')
+
+    @property
+    def file_catalog_path(self) -> str:
+        return self._path('.all-repos-files')
+
+    @property
+    def index_path(self) -> str:
+        return self._path('.all-repos-index.db')
+
+    @property
+    def http_cache_path(self) -> str:
+        return self._path('.all-repos-http-cache')
+
+    @property
+    def trash_path(self) -> str:
+        return self._path('.all-repos-trash')
+
+    @property
+    def autofix_journal_dir(self) -> str:
+        return self._path('.all-repos-autofix')
+
     def get_cloned_repos(self) -> dict[str, str]:
         with open(self.repos_filtered_path) as f:
             return json.load(f)
@@ -60,7 +96,7 @@ def _check_output_dir(output_dir: str) -> None:
                 contents >= REPOS_JSON_FILES and
                 all(
                     os.path.isdir(os.path.join(output_dir, d))
-                    for d in contents - REPOS_JSON_FILES
+                    for d in contents - REPOS_JSON_FILES - STATE_FILES
                 )
         ):
             raise SystemExit(
@@ -84,9 +120,17 @@ def load_config(filename: str) -> Config:
     include = re.compile(contents.get('include', ''))
     exclude = re.compile(contents.get('exclude', '^$'))
     all_branches = contents.get('all_branches', False)
+    clone_filter = contents.get('clone_filter')
+    depth = contents.get('depth')
     return Config(
         output_dir=output_dir, include=include, exclude=exclude,
-        list_repos=source_module.list_repos, source_settings=source_settings,
+        list_repos=source_module.list_repos,
+        list_repos_metadata=getattr(
+            source_module, 'list_repos_metadata', None,
+        ),
+        source_settings=source_settings,
         push=push_module.push, push_settings=push_settings,
         all_branches=all_branches,
+        clone_filter=clone_filter,
+        depth=depth,
     )
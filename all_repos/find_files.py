@@ -1,46 +1,216 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
+import functools
+import json
+import mmap
 import os.path
 import re
 import subprocess
 import sys
+from collections.abc import Container
+from collections.abc import Generator
+from collections.abc import Iterable
 from collections.abc import Sequence
+from typing import NamedTuple
 
 from all_repos import cli
 from all_repos import color
+from all_repos import mapper
 from all_repos.config import Config
 from all_repos.config import load_config
 from all_repos.util import zsplit
 
 
-def ls_files(config: Config, repo: str) -> tuple[str, list[bytes]]:
-    path = os.path.join(config.output_dir, repo)
-    ret = subprocess.run(
+# `git ls-files -z` output, stored in the repository's git directory
+CACHE_FILE = 'all-repos-ls-files'
+
+
+def _index_key(path: str) -> bytes | None:
+    # the index ends with a checksum of its contents, `None` when there is no
+    # index (or it was written without a checksum: `index.skipHash`)
+    try:
+        with open(os.path.join(path, '.git', 'index'), 'rb') as f:
+            f.seek(-20, os.SEEK_END)
+            checksum = f.read()
+    except OSError:
+        return None
+    else:
+        return checksum.hex().encode() if any(checksum) else None
+
+
+def _ls_files(path: str) -> tuple[bytes | None, bytes]:
+    key = _index_key(path)
+    cache = os.path.join(path, '.git', CACHE_FILE)
+    if key is not None:
+        try:
+            with open(cache, 'rb') as f:
+                cache_key, _, out = f.read().partition(b'\n')
+        except OSError:
+            pass
+        else:
+            if cache_key == key:
+                return key, out
+
+    out = subprocess.run(
         ('git', '-C', path, 'ls-files', '-z'),
         stdout=subprocess.PIPE, check=True,
-    )
-    return path, zsplit(ret.stdout)
+    ).stdout
+    if key is not None:
+        with open(f'{cache}.tmp', 'wb') as f:
+            f.write(key + b'\n' + out)
+        os.replace(f'{cache}.tmp', cache)
+    return key, out
+
+
+def ls_files(config: Config, repo: str) -> tuple[str, list[bytes]]:
+    path = os.path.join(config.output_dir, repo)
+    _, out = _ls_files(path)
+    return path, zsplit(out)
+
+
+def _catalog_listing(config: Config, repo: str) -> tuple[str | None, bytes]:
+    key, out = _ls_files(os.path.join(config.output_dir, repo))
+    # newline separated so `^` / `$` (multiline) match at path boundaries
+    if key is None or b'\n' in out:
+        return None, b''
+    else:
+        return key.decode(), out.replace(b'\0', b'\n')
+
+
+def update_catalog(
+        config: Config,
+        repos: Iterable[str],
+        *,
+        jobs: int,
+) -> None:
+    repos = tuple(repos)
+    with mapper.thread_mapper(jobs) as do_map:
+        listings = list(
+            do_map(functools.partial(_catalog_listing, config), repos),
+        )
 
+    entries = []
+    pos = 0
+    for repo, (key, listing) in zip(repos, listings):
+        entries.append((repo, key, pos, pos + len(listing)))
+        pos += len(listing)
 
-def find_files(config: Config, pattern: str) -> dict[str, list[bytes]]:
+    with open(f'{config.file_catalog_path}.tmp', 'wb') as f:
+        f.write(json.dumps({'repos': entries}).encode() + b'\n')
+        for _, listing in listings:
+            f.write(listing)
+    os.replace(f'{config.file_catalog_path}.tmp', config.file_catalog_path)
+
+
+class _Catalog(NamedTuple):
+    buf: mmap.mmap
+    # (repo, start, end) of the up to date repositories
+    ranges: list[tuple[str, int, int]]
+
+    def search(self, regex: re.Pattern[bytes]) -> dict[str, list[bytes]]:
+        # the multiline pattern may match more (for instance across paths)
+        # so each candidate path is checked against the original pattern
+        candidates = re.compile(regex.pattern, regex.flags | re.MULTILINE)
+        ret = {}
+        for repo, start, end in self.ranges:
+            matched = []
+            pos = start
+            while True:
+                match = candidates.search(self.buf, pos, end)
+                if match is None:
+                    break
+                path_end = self.buf.find(b'\n', match.start(), end)
+                if path_end == -1:  # an empty match at the end
+                    break
+                path_start = self.buf.rfind(b'\n', pos, match.start()) + 1
+                filename = self.buf[max(path_start, pos):path_end]
+                if regex.search(filename):
+                    matched.append(filename)
+                pos = path_end + 1
+            if matched:
+                ret[repo] = matched
+        return ret
+
+
+@contextlib.contextmanager
+def _catalog(
+        config: Config,
+        repos: Container[str],
+) -> Generator[_Catalog | None]:
+    try:
+        f = open(config.file_catalog_path, 'rb')
+    except FileNotFoundError:
+        yield None
+        return
+
+    with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        header_end = buf.find(b'\n')
+        header = json.loads(buf[:header_end])
+        offset = header_end + 1
+        yield _Catalog(
+            buf,
+            [
+                (repo, offset + start, offset + end)
+                for repo, key, start, end in header['repos']
+                if key is not None and repo in repos and
+                _index_key(os.path.join(config.output_dir, repo)) ==
+                key.encode()
+            ],
+        )
+
+
+def _matching_files(
+        config: Config,
+        pattern: bytes,
+        repo: str,
+) -> tuple[str, list[bytes]]:
+    regex = re.compile(pattern)
+    path, filenames = ls_files(config, repo)
+    return path, [f for f in filenames if regex.search(f)]
+
+
+def find_files(
+        config: Config,
+        pattern: str,
+        *,
+        jobs: int = 1,
+) -> dict[str, list[bytes]]:
     regex = re.compile(pattern.encode())
     repos = config.get_cloned_repos()
-    ret = {}
-    for repo in repos:
-        repo, filenames = ls_files(config, repo)
-        matched = [f for f in filenames if regex.search(f)]
-        if matched:
-            ret[repo] = matched
-    return ret
+
+    matched = {}
+    todo = list(repos)
+    # `\A` / `\Z` and lookarounds would see the neighbouring paths (a path
+    # ends in `\n` rather than the end of the string), they could miss matches
+    if not re.search(rb'\\[AZ]|\(\?<?[=!]', regex.pattern):
+        with _catalog(config, repos) as catalog:
+            if catalog is not None:
+                matched.update(catalog.search(regex))
+                cataloged = {repo for repo, _, _ in catalog.ranges}
+                todo = [repo for repo in todo if repo not in cataloged]
+
+    # repositories which are not (or no longer correctly) in the catalog
+    func = functools.partial(_matching_files, config, regex.pattern)
+    with mapper.process_mapper(jobs) as do_map:
+        for repo, (_, filenames) in zip(todo, do_map(func, todo)):
+            matched[repo] = filenames
+
+    return {
+        os.path.join(config.output_dir, repo): matched[repo]
+        for repo in repos
+        if matched.get(repo)
+    }
 
 
 def find_files_repos_cli(
         config: Config, pattern: str,
         *,
         use_color: bool,
+        jobs: int = 1,
 ) -> int:
-    repo_files = find_files(config, pattern)
+    repo_files = find_files(config, pattern, jobs=jobs)
     for repo in repo_files:
         print(repo)
     return not repo_files
@@ -52,9 +222,10 @@ def find_files_cli(
         *,
         output_paths: bool,
         use_color: bool,
+        jobs: int = 1,
 ) -> int:
     sep = os.sep.encode() if output_paths else b':'
-    repo_files = find_files(config, pattern)
+    repo_files = find_files(config, pattern, jobs=jobs)
     for repo, matching in repo_files.items():
         for filename in matching:
             sys.stdout.buffer.write(
@@ -75,16 +246,20 @@ def main(argv: Sequence[str] | None = None) -> int:
     cli.add_common_args(parser)
     cli.add_repos_with_matches_arg(parser)
     cli.add_output_paths_arg(parser)
+    cli.add_jobs_arg(parser)
     parser.add_argument('pattern', help='the python regex to match.')
     args = parser.parse_args(argv)
 
     config = load_config(args.config_filename)
     if args.repos_with_matches:
-        return find_files_repos_cli(config, args.pattern, use_color=args.color)
+        return find_files_repos_cli(
+            config, args.pattern, use_color=args.color, jobs=args.jobs,
+        )
     else:
         return find_files_cli(
             config, args.pattern,
             output_paths=args.output_paths, use_color=args.color,
+            jobs=args.jobs,
         )
 
 
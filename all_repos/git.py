@@ -1,9 +1,60 @@
 from __future__ import annotations
 
+import os.path
+import re
 import subprocess
 
+# only the simple subset of the git config syntax is parsed, anything else
+# (quoting, escapes, continuations, includes) is left to `git config`
+_SECTION_RE = re.compile(
+    r'\[\s*([A-Za-z0-9.-]+)\s*(?:"([^"\\]*)")?\s*\]\s*(?:[#;].*)?',
+)
+_KEY_RE = re.compile(
+    r'([A-Za-z][A-Za-z0-9-]*)\s*(?:=\s*([^"\\#;]*?))?\s*(?:[#;].*)?',
+)
+
+
+def _parse_remote(contents: str) -> str | None:
+    # `None` indicates that `git config` must be asked instead
+    in_origin = False
+    url = None
+    for line in contents.splitlines():
+        line = line.strip()
+        if not line or line.startswith(('#', ';')):
+            continue
+
+        section_match = _SECTION_RE.fullmatch(line)
+        if section_match is not None:
+            name, subsection = section_match.groups()
+            name = name.lower()
+            if name in {'include', 'includeif'}:
+                return None
+            in_origin = (
+                (name == 'remote' and subsection == 'origin') or
+                (name == 'remote.origin' and subsection is None)
+            )
+            continue
+
+        key_match = _KEY_RE.fullmatch(line)
+        if key_match is None:
+            return None
+        key, value = key_match.groups()
+        # the last value wins, just like `git config`
+        if in_origin and key.lower() == 'url' and value is not None:
+            url = value
+    return url
+
 
 def remote(path: str) -> str:
+    config = os.path.join(path, '.git', 'config')
+    try:
+        with open(config, encoding='UTF-8') as f:
+            url = _parse_remote(f.read())
+    except (OSError, UnicodeDecodeError):  # worktrees, submodules, etc.
+        url = None
+    if url is not None:
+        return url
+
     return subprocess.check_output((
         'git', '-C', path, 'config', 'remote.origin.url',
     )).decode().strip()
@@ -1,11 +1,23 @@
 from __future__ import annotations
 
+import functools
 import json
+import urllib.parse
 import urllib.request
 from typing import Any
 from typing import NamedTuple
 from typing import TypeVar
 
+from all_repos import http_pool
+from all_repos import mapper
+from all_repos.repo_metadata import parse_id
+from all_repos.repo_metadata import parse_timestamp
+from all_repos.repo_metadata import remotes
+from all_repos.repo_metadata import RepoMetadata
+
+# how many pages are fetched concurrently
+PAGINATION_JOBS = 8
+
 
 class Response(NamedTuple):
     json: Any
@@ -29,14 +41,53 @@ def _parse_link(lnk: str | None) -> dict[str, str]:
 
 
 def req(url: str, **kwargs: Any) -> Response:
-    resp = urllib.request.urlopen(urllib.request.Request(url, **kwargs))
+    resp = http_pool.urlopen(urllib.request.Request(url, **kwargs))
     return Response(json.load(resp), _parse_link(resp.headers['link']))
 
 
-def get_all(url: str, **kwargs: Any) -> list[dict[str, Any]]:
+def _page(url: str) -> int | None:
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+    page = query.get('page', [''])[-1]
+    return int(page) if page.isdigit() else None
+
+
+def _page_urls(links: dict[str, str]) -> list[str] | None:
+    if 'next' not in links or 'last' not in links:
+        return None
+    next_page, last_page = _page(links['next']), _page(links['last'])
+    if next_page is None or last_page is None:
+        return None
+
+    parsed = urllib.parse.urlsplit(links['next'])
+    query = urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+
+    def _url(page: int) -> str:
+        page_query = [(k, str(page) if k == 'page' else v) for k, v in query]
+        page_parsed = parsed._replace(query=urllib.parse.urlencode(page_query))
+        return page_parsed.geturl()
+
+    return [_url(page) for page in range(next_page, last_page + 1)]
+
+
+def get_all(
+        url: str,
+        *,
+        jobs: int = PAGINATION_JOBS,
+        **kwargs: Any,
+) -> list[dict[str, Any]]:
     ret: list[dict[str, Any]] = []
     resp = req(url, **kwargs)
     ret.extend(resp.json)
+
+    # when the last page is known, fetch the remaining pages concurrently
+    urls = _page_urls(resp.links)
+    if urls is not None:
+        func = functools.partial(req, **kwargs)
+        with mapper.thread_mapper(jobs) as do_map:
+            for resp in do_map(func, urls):
+                ret.extend(resp.json)
+        return ret
+
     while 'next' in resp.links:
         resp = req(resp.links['next'], **kwargs)
         ret.extend(resp.json)
@@ -50,12 +101,17 @@ def _strip_trailing_dot_git(ssh_url: str) -> str:
         return ssh_url
 
 
-def filter_repos(
+def filter_repos_metadata(
         repos: list[dict[str, Any]], *,
         forks: bool, private: bool, collaborator: bool, archived: bool,
-) -> dict[str, str]:
+) -> dict[str, RepoMetadata]:
     return {
-        repo['full_name']: _strip_trailing_dot_git(repo['ssh_url'])
+        repo['full_name']: RepoMetadata(
+            remote=_strip_trailing_dot_git(repo['ssh_url']),
+            default_branch=repo.get('default_branch'),
+            pushed_at=parse_timestamp(repo.get('pushed_at')),
+            repo_id=parse_id(repo.get('id')),
+        )
         for repo in repos
         if (
             (forks or not repo['fork']) and
@@ -66,6 +122,21 @@ def filter_repos(
     }
 
 
+def filter_repos(
+        repos: list[dict[str, Any]], *,
+        forks: bool, private: bool, collaborator: bool, archived: bool,
+) -> dict[str, str]:
+    return remotes(
+        filter_repos_metadata(
+            repos,
+            forks=forks,
+            private=private,
+            collaborator=collaborator,
+            archived=archived,
+        ),
+    )
+
+
 T = TypeVar('T', list[Any], dict[str, Any], Any)
 
 
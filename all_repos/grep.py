@@ -1,13 +1,18 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import os.path
 import subprocess
 import sys
+from collections.abc import Generator
 from collections.abc import Sequence
+from typing import NamedTuple
 
 from all_repos import cli
 from all_repos import color
+from all_repos import index
+from all_repos import mapper
 from all_repos.config import Config
 from all_repos.config import load_config
 
@@ -20,33 +25,227 @@ def grep_result(
         config: Config,
         repo: str,
         args: Sequence[str],
-) -> tuple[str, int, bytes]:
+        query: index.Query | None = None,
+) -> tuple[str, int, bytes, bytes]:
     path = os.path.join(config.output_dir, repo)
+    if query is not None:
+        pruned_args = query.args_for(repo)
+        if pruned_args is None:
+            return path, 1, b'', b''
+        args = pruned_args
     ret = subprocess.run(
-        ('git', '-C', path, 'grep', *args), stdout=subprocess.PIPE,
+        ('git', '-C', path, 'grep', *args),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
     )
-    return path, ret.returncode, ret.stdout
-
-
-def grep(config: Config, grep_args: Sequence[str]) -> dict[str, bytes]:
-    repos = config.get_cloned_repos()
-    ret = {}
-    for repo in repos:
-        repo, returncode, stdout = grep_result(config, repo, grep_args)
-        if returncode == 0:
-            ret[repo] = stdout
-        elif returncode != 1:
-            raise GrepError(returncode)
+    return path, ret.returncode, ret.stdout, ret.stderr
+
+
+def grep_iter(
+        config: Config,
+        grep_args: Sequence[str],
+        *,
+        jobs: int = 1,
+) -> Generator[tuple[str, bytes]]:
+    repos = sorted(config.get_cloned_repos())
+    func = functools.partial(
+        grep_result, config,
+        args=grep_args, query=index.query(config, grep_args),
+    )
+    with mapper.bounded_thread_mapper(jobs) as do_map:
+        for repo, returncode, stdout, stderr in do_map(func, repos):
+            # replay stderr in repo order so output matches a serial run
+            sys.stderr.buffer.write(stderr)
+            sys.stderr.buffer.flush()
+            if returncode == 0:
+                yield repo, stdout
+            elif returncode != 1:
+                raise GrepError(returncode)
+
+
+def grep(
+        config: Config,
+        grep_args: Sequence[str],
+        *,
+        jobs: int = 1,
+) -> dict[str, bytes]:
+    return dict(grep_iter(config, grep_args, jobs=jobs))
+
+
+# options which take no argument and so may be shared by a combined query
+_COMBINABLE_OPTIONS = frozenset((
+    '--quiet',
+    '-F', '--fixed-strings',
+    '-E', '--extended-regexp',
+    '-G', '--basic-regexp',
+    '-P', '--perl-regexp',
+    '-i', '--ignore-case',
+    '-w', '--word-regexp',
+    '-I',
+))
+
+
+class _SplitQuery(NamedTuple):
+    options: tuple[str, ...]
+    pattern: str
+    pathspecs: tuple[str, ...]
+
+
+def _split_query(grep_args: Sequence[str]) -> _SplitQuery | None:
+    # only `[OPTIONS] PATTERN [-- PATHSPEC...]` can be combined
+    if '--' in grep_args:
+        sep = grep_args.index('--')
+        args, pathspecs = grep_args[:sep], tuple(grep_args[sep + 1:])
+    else:
+        args, pathspecs = grep_args, ()
+    if not args:
+        return None
+    *options, pattern = args
+    if (
+            not all(opt in _COMBINABLE_OPTIONS for opt in options) or
+            pattern.startswith('-')
+    ):
+        return None
+    return _SplitQuery(tuple(options), pattern, pathspecs)
+
+
+def _combine(
+        queries: Sequence[Sequence[str]],
+) -> tuple[tuple[str, ...], bool] | None:
+    # returns the arguments of a single `git grep` which matches if any of
+    # the queries do and whether it is exact (matches *only* if one does)
+    split = [_split_query(query) for query in queries]
+    if any(q is None for q in split):
+        return None
+    split_queries = [q for q in split if q is not None]
+    if len({q.options for q in split_queries}) != 1:
+        return None
+
+    patterns = [arg for q in split_queries for arg in ('-e', q.pattern)]
+    if all(q.pathspecs for q in split_queries):
+        pathspecs = dict.fromkeys(
+            pathspec for q in split_queries for pathspec in q.pathspecs
+        )
+        # a pattern may now match in another query's paths
+        exact = len({q.pathspecs for q in split_queries}) == 1
+    else:
+        pathspecs = {}
+        exact = all(not q.pathspecs for q in split_queries)
+    args = (*split_queries[0].options, *patterns, '--', *pathspecs)
+    return args, exact
+
+
+def _matching_result(
+        config: Config,
+        repo: str,
+        queries: Sequence[tuple[Sequence[str], index.Query | None]],
+        *,
+        any_match: bool,
+) -> tuple[str, list[int], bytes]:
+    path = os.path.join(config.output_dir, repo)
+    # `None` indicates that the index rules out a match
+    repo_args = [
+        grep_args if query is None else query.args_for(repo)
+        for grep_args, query in queries
+    ]
+
+    returncodes: list[int] = []
+    stderr = b''
+
+    # most repositories match none of the queries: try them all at once
+    live = [args for args in repo_args if args is not None]
+    combined = _combine(live) if len(live) > 1 else None
+    if combined is not None:
+        combined_args, exact = combined
+        ret = subprocess.run(
+            ('git', '-C', path, 'grep', *combined_args),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        stderr += ret.stderr
+        if ret.returncode != 0:
+            return path, [ret.returncode] * len(queries), stderr
+        elif any_match and exact:
+            return path, [0], stderr
+
+    for args in repo_args:
+        if args is None:
+            returncode = 1
+        else:
+            _, returncode, _, err = grep_result(config, repo, args)
+            stderr += err
+        returncodes.append(returncode)
+        if returncode not in {0, 1} or (any_match and returncode == 0):
+            break
+    return path, returncodes, stderr
+
+
+def _repos_matching_batch(
+        config: Config,
+        queries: Sequence[Sequence[str]],
+        *,
+        jobs: int,
+        any_match: bool,
+) -> list[set[str]]:
+    repos = sorted(config.get_cloned_repos())
+    grep_queries = []
+    for query in queries:
+        grep_args = ('--quiet', *query)
+        grep_queries.append((grep_args, index.query(config, grep_args)))
+    func = functools.partial(
+        _matching_result, config, queries=grep_queries, any_match=any_match,
+    )
+    ret: list[set[str]] = [set() for _ in queries]
+    with mapper.bounded_thread_mapper(jobs) as do_map:
+        for repo, returncodes, stderr in do_map(func, repos):
+            sys.stderr.buffer.write(stderr)
+            sys.stderr.buffer.flush()
+            for matching, returncode in zip(ret, returncodes):
+                if returncode == 0:
+                    matching.add(repo)
+                elif returncode != 1:
+                    raise GrepError(returncode)
     return ret
 
 
-def repos_matching(config: Config, grep_args: Sequence[str]) -> set[str]:
-    return set(grep(config, ('--quiet', *grep_args)))
+def repos_matching_batch(
+        config: Config,
+        queries: Sequence[Sequence[str]],
+        *,
+        jobs: int = 8,
+) -> list[set[str]]:
+    return _repos_matching_batch(config, queries, jobs=jobs, any_match=False)
+
+
+def repos_matching_any(
+        config: Config,
+        queries: Sequence[Sequence[str]],
+        *,
+        jobs: int = 8,
+) -> set[str]:
+    # stop querying a repository as soon as one of the queries matches
+    matching = _repos_matching_batch(
+        config, queries, jobs=jobs, any_match=True,
+    )
+    return set().union(*matching)
+
+
+def repos_matching(
+        config: Config,
+        grep_args: Sequence[str],
+        *,
+        jobs: int = 8,
+) -> set[str]:
+    matching, = repos_matching_batch(config, (grep_args,), jobs=jobs)
+    return matching
 
 
-def repos_matching_cli(config: Config, grep_args: Sequence[str]) -> int:
+def repos_matching_cli(
+        config: Config,
+        grep_args: Sequence[str],
+        *,
+        jobs: int,
+) -> int:
     try:
-        matching = repos_matching(config, grep_args)
+        matching = repos_matching(config, grep_args, jobs=jobs)
     except GrepError as e:
         return e.args[0]
     for repo in sorted(matching):
@@ -60,24 +259,26 @@ def grep_cli(
         *,
         output_paths: bool,
         use_color: bool,
+        jobs: int,
 ) -> int:
     sep = os.sep.encode() if output_paths else b':'
     if use_color:
         grep_args = ('--color=always', *grep_args)
+    matched = False
     try:
-        matching = grep(config, grep_args)
+        for repo, stdout in grep_iter(config, grep_args, jobs=jobs):
+            matched = True
+            repo_b = repo.encode()
+            for line in stdout.splitlines():
+                sys.stdout.buffer.write(
+                    color.fmtb(repo_b, color.BLUE_B, use_color=use_color) +
+                    color.fmtb(sep, color.TURQUOISE, use_color=use_color) +
+                    line + b'\n',
+                )
+            sys.stdout.buffer.flush()
     except GrepError as e:
         return e.args[0]
-    for repo, stdout in sorted(matching.items()):
-        repo_b = repo.encode()
-        for line in stdout.splitlines():
-            sys.stdout.buffer.write(
-                color.fmtb(repo_b, color.BLUE_B, use_color=use_color) +
-                color.fmtb(sep, color.TURQUOISE, use_color=use_color) +
-                line + b'\n',
-            )
-            sys.stdout.buffer.flush()
-    return int(not matching)
+    return int(not matched)
 
 
 def main(argv: Sequence[str] | None = None) -> int:
@@ -91,16 +292,19 @@ def main(argv: Sequence[str] | None = None) -> int:
         '--help', action='help', help='show this help message and exit',
     )
     cli.add_common_args(parser)
+    cli.add_jobs_arg(parser)
     cli.add_repos_with_matches_arg(parser)
     cli.add_output_paths_arg(parser)
     args, rest = parser.parse_known_args(argv)
 
     config = load_config(args.config_filename)
     if args.repos_with_matches:
-        return repos_matching_cli(config, rest)
+        return repos_matching_cli(config, rest, jobs=args.jobs)
     else:
         return grep_cli(
-            config, rest, output_paths=args.output_paths, use_color=args.color,
+            config, rest,
+            output_paths=args.output_paths, use_color=args.color,
+            jobs=args.jobs,
         )
 
 
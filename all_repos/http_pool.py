@@ -0,0 +1,503 @@
+from __future__ import annotations
+
+import base64
+import collections
+import contextlib
+import email.message
+import email.utils
+import hashlib
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import ssl
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections.abc import Generator
+from multiprocessing.sharedctypes import Synchronized
+from typing import NamedTuple
+
+# the same default urllib sends (some apis, such as github, require one)
+USER_AGENT = f'Python-urllib/{sys.version_info[0]}.{sys.version_info[1]}'
+# idle connections kept per host
+MAX_IDLE = 16
+MAX_REDIRECTS = 10
+# once fewer requests than this remain, spread them until the limit resets
+PACE_BELOW = 100
+# space out mutating requests to avoid (github's) secondary rate limits
+MUTATING_INTERVAL = 1.
+MAX_RETRIES = 5
+BACKOFF = 2.
+# github asks to wait at least a minute after hitting a secondary rate limit
+SECONDARY_BACKOFF = 60.
+
+# the server closed an idle keep-alive connection, retry on a new one
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+)
+_REDIRECTS = frozenset((301, 302, 303, 307, 308))
+
+_lock = threading.Lock()
+_idle: dict[tuple[str, str], list[http.client.HTTPConnection]]
+_idle = collections.defaultdict(list)
+_ssl_context: ssl.SSLContext | None = None
+_cache_dir: str | None = None
+_cache_used: set[str] = set()
+_budgets: dict[str, _Budget] = {}
+# shared by worker processes (see `mutating_clock`), when set mutating
+# requests are spaced out across all of them rather than per process
+_mutating_clock: Synchronized[float] | None = None
+
+
+def _after_fork_in_child() -> None:
+    global _lock
+    # connections must not be shared with the parent process
+    _lock = threading.Lock()
+    _idle.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class Response(io.BytesIO):
+    def __init__(
+            self,
+            body: bytes,
+            *,
+            url: str,
+            status: int,
+            headers: http.client.HTTPMessage,
+    ) -> None:
+        super().__init__(body)
+        self.url = url
+        self.status = status
+        self.headers = headers
+
+
+def _connect(scheme: str, host: str) -> http.client.HTTPConnection:
+    global _ssl_context
+
+    if scheme == 'https':
+        with _lock:
+            if _ssl_context is None:
+                _ssl_context = ssl.create_default_context()
+        return http.client.HTTPSConnection(host, context=_ssl_context)
+    else:
+        return http.client.HTTPConnection(host)
+
+
+def _acquire(key: tuple[str, str]) -> tuple[http.client.HTTPConnection, bool]:
+    with _lock:
+        if _idle[key]:
+            return _idle[key].pop(), True
+    return _connect(*key), False
+
+
+def _release(
+        key: tuple[str, str],
+        conn: http.client.HTTPConnection,
+) -> None:
+    with _lock:
+        if len(_idle[key]) < MAX_IDLE:
+            _idle[key].append(conn)
+            return
+    conn.close()
+
+
+def close() -> None:
+    with _lock:
+        conns = [conn for conns in _idle.values() for conn in conns]
+        _idle.clear()
+    for conn in conns:
+        conn.close()
+
+
+def _use_pool(req: urllib.request.Request) -> bool:
+    # leave proxies (and other schemes) to urllib
+    proxies = urllib.request.getproxies()
+    return (
+        req.type in {'http', 'https'} and
+        (req.type not in proxies or urllib.request.proxy_bypass(req.host))
+    )
+
+
+def _headers(req: urllib.request.Request) -> dict[str, str]:
+    # mirror the defaults urllib would have sent
+    headers = {'User-agent': USER_AGENT}
+    if req.data is not None:
+        headers['Content-type'] = 'application/x-www-form-urlencoded'
+    headers.update(req.header_items())
+    return headers
+
+
+def _send(req: urllib.request.Request) -> Response:
+    key = (req.type, req.host)
+    for attempt in range(2):
+        conn, reused = _acquire(key)
+        try:
+            conn.request(
+                req.get_method(), req.selector,
+                body=req.data, headers=_headers(req),
+            )
+            resp = conn.getresponse()
+            body = resp.read()
+        except _STALE_ERRORS:
+            conn.close()
+            if reused and not attempt:
+                continue
+            raise
+        except BaseException:
+            conn.close()
+            raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            _release(key, conn)
+        return Response(
+            body,
+            url=req.get_full_url(), status=resp.status, headers=resp.headers,
+        )
+    raise AssertionError('unreachable')
+
+
+def _open(req: urllib.request.Request) -> Response:
+    if not _use_pool(req):
+        try:
+            with urllib.request.urlopen(req) as resp:
+                return Response(
+                    resp.read(),
+                    url=resp.geturl(), status=resp.status,
+                    headers=resp.headers,
+                )
+        except urllib.error.HTTPError as e:
+            # buffer the body so it can be inspected without consuming it
+            raise urllib.error.HTTPError(
+                e.url, e.code, e.msg, e.headers, io.BytesIO(e.read()),
+            ) from None
+
+    redirect_handler = urllib.request.HTTPRedirectHandler()
+    for _ in range(MAX_REDIRECTS + 1):
+        resp = _send(req)
+        location = resp.headers['location']
+        if resp.status in _REDIRECTS and location is not None:
+            new_url = urllib.parse.urljoin(req.get_full_url(), location)
+            # raises `HTTPError` for redirects urllib would not follow
+            new_req = redirect_handler.redirect_request(
+                req, resp, resp.status, '', resp.headers, new_url,
+            )
+            if new_req is not None:
+                req = new_req
+                continue
+
+        if resp.status >= 400:
+            msg = http.client.responses.get(resp.status, '')
+            raise urllib.error.HTTPError(
+                resp.url, resp.status, msg, resp.headers, resp,
+            )
+        return resp
+    else:
+        raise urllib.error.HTTPError(
+            req.get_full_url(), resp.status, 'too many redirects',
+            resp.headers, resp,
+        )
+
+
+class _Budget:
+    # guarded by `_lock` (which is recreated after a fork)
+    def __init__(self) -> None:
+        self.remaining: int | None = None
+        self.reset: float | None = None
+        self.not_before = 0.
+        self.next_paced = 0.
+        self.next_mutating = 0.
+
+    def reserve(self, *, mutating: bool) -> float:
+        # returns the time at which the request may be sent
+        at = max(time.time(), self.not_before)
+        if mutating and _mutating_clock is not None:
+            with _mutating_clock.get_lock():
+                at = max(at, _mutating_clock.value)
+                _mutating_clock.value = at + MUTATING_INTERVAL
+        elif mutating:
+            at = self.next_mutating = max(at, self.next_mutating)
+            self.next_mutating += MUTATING_INTERVAL
+        if (
+                self.remaining is not None and
+                self.reset is not None and
+                self.reset > at
+        ):
+            if self.remaining <= 0:
+                at = self.reset
+            elif self.remaining < PACE_BELOW:
+                at = self.next_paced = max(at, self.next_paced)
+                self.next_paced += (self.reset - at) / self.remaining
+            self.remaining -= 1
+        return at
+
+    def update(self, headers: email.message.Message) -> None:
+        remaining = _int_header(headers, 'RateLimit-Remaining')
+        reset = _int_header(headers, 'RateLimit-Reset')
+        if remaining is None:
+            return
+        elif reset is None or reset == self.reset:
+            # responses to concurrent requests arrive in any order
+            if self.remaining is not None:
+                remaining = min(remaining, self.remaining)
+        self.remaining = remaining
+        self.reset = None if reset is None else float(reset)
+
+
+def _int_header(headers: email.message.Message, name: str) -> int | None:
+    # github / azure use an `X-` prefix, gitlab sends both
+    value = headers[f'X-{name}'] or headers[name]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after(headers: email.message.Message) -> float | None:
+    value = headers['Retry-After']
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:  # an http-date
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    else:
+        return retry_at.timestamp() - time.time()
+
+
+def _rate_limit_delay(
+        e: urllib.error.HTTPError,
+        attempt: int,
+) -> float | None:
+    if e.code not in {403, 429}:
+        return None
+
+    retry_after = _retry_after(e.headers)
+    reset = _int_header(e.headers, 'RateLimit-Reset')
+    if retry_after is not None:
+        return max(retry_after, 0)
+    elif _int_header(e.headers, 'RateLimit-Remaining') == 0 and reset:
+        return max(reset - time.time(), 0)
+    elif (
+            isinstance(e.fp, io.BytesIO) and
+            b'secondary rate limit' in e.fp.getvalue().lower()
+    ):
+        # github's secondary rate limits often come without any headers
+        return SECONDARY_BACKOFF * 2 ** attempt
+    elif e.code == 429:
+        return BACKOFF * 2 ** attempt
+    else:  # a 403 which is not rate limiting (permissions, etc.)
+        return None
+
+
+def mutating_clock() -> Synchronized[float]:
+    # pass to `use_mutating_clock` in each worker process (for instance as
+    # an executor `initializer`) so their mutating requests share one pace
+    return multiprocessing.get_context('spawn').Value('d', 0.)
+
+
+def use_mutating_clock(clock: Synchronized[float]) -> None:
+    global _mutating_clock
+    _mutating_clock = clock
+
+
+def _urlopen(req: urllib.request.Request) -> Response:
+    mutating = req.get_method() not in {'GET', 'HEAD'}
+    for attempt in range(MAX_RETRIES + 1):
+        with _lock:
+            host_budget = _budgets.setdefault(req.host, _Budget())
+            at = host_budget.reserve(mutating=mutating)
+        time.sleep(max(at - time.time(), 0))
+
+        try:
+            resp = _open(req)
+        except urllib.error.HTTPError as e:
+            delay = _rate_limit_delay(e, attempt)
+            with _lock:
+                host_budget.update(e.headers)
+                if delay is not None:
+                    host_budget.not_before = max(
+                        host_budget.not_before, time.time() + delay,
+                    )
+            if delay is not None and mutating and _mutating_clock is not None:
+                # hold back the other processes' mutating requests too
+                with _mutating_clock.get_lock():
+                    _mutating_clock.value = max(
+                        _mutating_clock.value, time.time() + delay,
+                    )
+            if delay is None or attempt == MAX_RETRIES:
+                raise
+            print(
+                f'{req.host}: rate limited, retrying in {delay:.0f}s',
+                file=sys.stderr,
+            )
+        else:
+            with _lock:
+                host_budget.update(resp.headers)
+            return resp
+    raise AssertionError('unreachable')
+
+
+# headers of a `304` which describe the (empty) message rather than the
+# stored response
+_NOT_UPDATED = frozenset((
+    'connection', 'content-length', 'content-encoding', 'keep-alive',
+    'transfer-encoding',
+))
+
+
+class _CacheEntry(NamedTuple):
+    url: str
+    headers: list[tuple[str, str]]
+    body: str
+
+    @property
+    def etag(self) -> str | None:
+        return self._header('ETag')
+
+    @property
+    def last_modified(self) -> str | None:
+        return self._header('Last-Modified')
+
+    def _header(self, name: str) -> str | None:
+        for k, v in self.headers:
+            if k.lower() == name.lower():
+                return v
+        else:
+            return None
+
+    def updated(self, headers: email.message.Message) -> _CacheEntry:
+        # the `304`'s headers replace the stored ones (RFC 9111 4.3.4), for
+        # instance a `Link` which now points at a new last page
+        names = {k.lower() for k in headers.keys()} - _NOT_UPDATED
+        return self._replace(
+            headers=[
+                *((k, v) for k, v in self.headers if k.lower() not in names),
+                *((k, v) for k, v in headers.items() if k.lower() in names),
+            ],
+        )
+
+    def response(self) -> Response:
+        headers = http.client.HTTPMessage()
+        for k, v in self.headers:
+            headers[k] = v
+        return Response(
+            base64.b64decode(self.body),
+            url=self.url, status=200, headers=headers,
+        )
+
+
+def _cache_key(req: urllib.request.Request) -> str:
+    # the key includes the (hashed) credentials so responses are not shared
+    # between users
+    parts = [req.get_full_url(), *sorted(map(repr, req.header_items()))]
+    return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+
+def _cache_load(path: str) -> _CacheEntry | None:
+    try:
+        with open(path) as f:
+            contents = json.load(f)
+    except (OSError, ValueError):
+        return None
+    else:
+        return _CacheEntry(
+            url=contents['url'],
+            headers=[tuple(kv) for kv in contents['headers']],
+            body=contents['body'],
+        )
+
+
+def _cache_save(path: str, entry: _CacheEntry) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(entry._asdict(), f)
+    os.replace(f'{path}.tmp', path)
+
+
+def _cached_urlopen(
+        req: urllib.request.Request,
+        cache_dir: str,
+) -> Response:
+    key = _cache_key(req)
+    with _lock:
+        _cache_used.add(key)
+    path = os.path.join(cache_dir, f'{key}.json')
+
+    cached = _cache_load(path)
+    if cached is not None:
+        if cached.etag is not None:
+            req.add_unredirected_header('If-none-match', cached.etag)
+        if cached.last_modified is not None:
+            req.add_unredirected_header(
+                'If-modified-since', cached.last_modified,
+            )
+
+    try:
+        resp = _urlopen(req)
+    except urllib.error.HTTPError as e:  # urllib treats 304 as an error
+        if e.code == 304 and cached is not None:
+            headers = e.headers
+        else:
+            raise
+    else:
+        if resp.status == 304 and cached is not None:
+            headers = resp.headers
+        else:
+            if resp.headers['ETag'] or resp.headers['Last-Modified']:
+                _cache_save(
+                    path,
+                    _CacheEntry(
+                        url=resp.url,
+                        headers=list(resp.headers.items()),
+                        body=base64.b64encode(resp.getvalue()).decode(),
+                    ),
+                )
+            return resp
+
+    cached = cached.updated(headers)
+    _cache_save(path, cached)
+    return cached.response()
+
+
+@contextlib.contextmanager
+def cache(path: str) -> Generator[None]:
+    # GET responses are stored in `path` and revalidated using conditional
+    # requests (`ETag` / `Last-Modified`), a `304` is served from disk
+    global _cache_dir
+
+    _cache_dir = path
+    _cache_used.clear()
+    try:
+        yield
+    finally:
+        _cache_dir = None
+
+    # only reached on success: forget responses which were not requested
+    if not os.path.exists(path):
+        return
+    for filename in os.listdir(path):
+        key, _, _ = filename.partition('.')
+        if key not in _cache_used:
+            os.remove(os.path.join(path, filename))
+
+
+def urlopen(req: urllib.request.Request) -> Response:
+    cache_dir = _cache_dir
+    if cache_dir is not None and req.get_method() == 'GET':
+        return _cached_urlopen(req, cache_dir)
+    else:
+        return _urlopen(req)
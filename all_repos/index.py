@@ -0,0 +1,420 @@
+from __future__ import annotations
+
+import argparse
+import array
+import collections
+import contextlib
+import os.path
+import re
+import sqlite3
+import subprocess
+from collections.abc import Generator
+from collections.abc import Iterable
+from collections.abc import Sequence
+from typing import NamedTuple
+
+from all_repos import cat_file
+from all_repos import cli
+from all_repos import mapper
+from all_repos.config import Config
+from all_repos.config import load_config
+from all_repos.util import zsplit
+
+# larger files are not indexed, they are always handed to `git grep`
+MAX_FILE_SIZE = 1024 * 1024
+# passing more candidate files than this as pathspecs is not worth it
+MAX_PATHSPECS = 256
+# bound the number of trigrams (and therefore sql parameters) per query
+MAX_TRIGRAMS = 64
+
+_SCHEMA = '''\
+CREATE TABLE IF NOT EXISTS repos (
+    repo TEXT PRIMARY KEY,
+    tree TEXT NOT NULL,
+    head TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trees (tree TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS files (
+    tree TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    path BLOB NOT NULL,
+    indexed INTEGER NOT NULL,
+    PRIMARY KEY (tree, id)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    tree TEXT NOT NULL,
+    trigram BLOB NOT NULL,
+    ids BLOB NOT NULL,
+    PRIMARY KEY (tree, trigram)
+);
+'''
+
+_FLAGS = frozenset((
+    '-I', '-w', '--word-regexp', '-n', '--line-number', '--column',
+    '-l', '--files-with-matches', '--name-only', '-h', '-H', '-c', '--count',
+    '-q', '--quiet', '-o', '--only-matching', '-z', '--null',
+    '--full-name', '--heading', '--break', '--no-color',
+))
+_SHORT_FLAGS = frozenset('IwnlhHcqoz')
+_FIXED = frozenset(('-F', '--fixed-strings'))
+_REGEX = frozenset((
+    '-E', '--extended-regexp', '-G', '--basic-regexp', '-P', '--perl-regexp',
+))
+_IGNORE_CASE = frozenset(('-i', '--ignore-case'))
+_SHA_RE = re.compile('[0-9a-f]{40}|[0-9a-f]{64}')
+
+
+@contextlib.contextmanager
+def _connect(config: Config) -> Generator[sqlite3.Connection]:
+    with contextlib.closing(sqlite3.connect(config.index_path)) as db:
+        yield db
+
+
+class _TreeIndex(NamedTuple):
+    files: list[bytes]
+    indexed: list[bool]
+    postings: dict[bytes, list[int]]
+
+
+def _head_commit(path: str) -> str | None:
+    # resolve HEAD without running `git`, `None` when it cannot be resolved
+    # (no commits, an unusual ref storage, ...)
+    git_dir = os.path.join(path, '.git')
+    try:
+        with open(os.path.join(git_dir, 'HEAD')) as f:
+            head = f.read().strip()
+        if head.startswith('ref: '):
+            ref = head.removeprefix('ref: ')
+            try:
+                with open(os.path.join(git_dir, ref)) as f:
+                    head = f.read().strip()
+            except FileNotFoundError:
+                with open(os.path.join(git_dir, 'packed-refs')) as f:
+                    for line in f:
+                        sha, _, name = line.rstrip('\n').partition(' ')
+                        if name == ref:
+                            head = sha
+                            break
+                    else:
+                        return None
+    except (OSError, UnicodeDecodeError):
+        return None
+    return head if _SHA_RE.fullmatch(head) else None
+
+
+def _head(path: str) -> tuple[str, str] | None:
+    head = _head_commit(path)
+    if head is None:
+        return None
+    try:
+        out = subprocess.check_output(
+            ('git', '-C', path, 'rev-parse', '--verify', '--quiet',
+             f'{head}^{{tree}}'),
+        )
+    except subprocess.CalledProcessError:
+        return None
+    else:
+        return head, out.decode().strip()
+
+
+def _trigrams(contents: bytes) -> set[bytes]:
+    contents = contents.lower()
+    return {contents[i:i + 3] for i in range(len(contents) - 2)}
+
+
+def _index_tree(tree_path: tuple[str, str]) -> _TreeIndex:
+    # the tree rather than HEAD, which may have moved since it was resolved
+    tree, path = tree_path
+    out = subprocess.check_output((
+        'git', '-C', path, 'ls-tree', '-r', '-z', '-l', '--full-tree', tree,
+    ))
+    files: list[bytes] = []
+    indexed: list[bool] = []
+    to_read: list[tuple[int, str]] = []
+    for entry in zsplit(out):
+        info, _, filename = entry.partition(b'\t')
+        mode, tp, sha, size = info.decode().split()
+        if tp != 'blob':  # submodules
+            continue
+        file_id = len(files)
+        files.append(filename)
+        # symlinks are not read through the blob contents, always grep them
+        if mode == '120000' or int(size) > MAX_FILE_SIZE:
+            indexed.append(False)
+            continue
+
+        indexed.append(True)
+        to_read.append((file_id, sha))
+
+    postings: dict[bytes, list[int]] = collections.defaultdict(list)
+    with cat_file.batch(path) as batch:
+        for file_id, sha in to_read:
+            for trigram in _trigrams(batch.read(sha)):
+                postings[trigram].append(file_id)
+    return _TreeIndex(files, indexed, dict(postings))
+
+
+def _write_tree(db: sqlite3.Connection, tree: str, idx: _TreeIndex) -> None:
+    db.execute('INSERT INTO trees VALUES (?)', (tree,))
+    db.executemany(
+        'INSERT INTO files VALUES (?, ?, ?, ?)',
+        (
+            (tree, file_id, filename, indexed)
+            for file_id, (filename, indexed) in enumerate(
+                zip(idx.files, idx.indexed),
+            )
+        ),
+    )
+    db.executemany(
+        'INSERT INTO postings VALUES (?, ?, ?)',
+        (
+            (tree, trigram, array.array('I', ids).tobytes())
+            for trigram, ids in idx.postings.items()
+        ),
+    )
+
+
+def update(config: Config, repos: Iterable[str], *, jobs: int) -> None:
+    repos = tuple(repos)
+    paths = [os.path.join(config.output_dir, repo) for repo in repos]
+    with mapper.thread_mapper(jobs) as do_map:
+        heads = {
+            repo: head
+            for repo, head in zip(repos, do_map(_head, paths))
+            if head is not None
+        }
+
+    with _connect(config) as db:
+        db.executescript(_SCHEMA)
+        indexed = {tree for tree, in db.execute('SELECT tree FROM trees')}
+        todo: dict[str, str] = {}
+        for repo, (_, tree) in heads.items():
+            if tree not in indexed and tree not in todo:
+                todo[tree] = os.path.join(config.output_dir, repo)
+
+        with mapper.process_mapper(jobs) as do_map:
+            for tree, idx in zip(todo, do_map(_index_tree, todo.items())):
+                print(f'Indexed {todo[tree]}')
+                _write_tree(db, tree, idx)
+                db.commit()
+
+        # recreated rather than emptied, indexes from before the head column
+        db.execute('DROP TABLE repos')
+        db.executescript(_SCHEMA)
+        db.executemany(
+            'INSERT INTO repos VALUES (?, ?, ?)',
+            ((repo, tree, head) for repo, (head, tree) in heads.items()),
+        )
+        for table in ('trees', 'files', 'postings'):
+            db.execute(
+                f'DELETE FROM {table} '
+                f'WHERE tree NOT IN (SELECT tree FROM repos)',
+            )
+        db.commit()
+
+
+def _literal_runs(pattern: bytes) -> list[bytes]:
+    # only handle the simple subset of regex syntax which is the same for
+    # basic / extended / perl regexes -- anything else is not pruned
+    if any(c in pattern for c in (b'\\', b'(', b')', b'|', b'{', b'[:')):
+        return []
+
+    runs = []
+    run = b''
+    i = 0
+    while i < len(pattern):
+        c = pattern[i:i + 1]
+        if c == b'[':
+            end = i + 1
+            if pattern[end:end + 1] == b'^':
+                end += 1
+            if pattern[end:end + 1] == b']':
+                end += 1
+            end = pattern.find(b']', end)
+            if end == -1:
+                return []
+            runs.append(run)
+            run = b''
+            i = end
+        elif c in {b'*', b'?', b'+'}:
+            runs.append(run[:-1])
+            run = b''
+        elif c in {b'.', b'^', b'$'}:
+            runs.append(run)
+            run = b''
+        else:
+            run += c
+        i += 1
+    runs.append(run)
+    return runs
+
+
+class _GrepArgs(NamedTuple):
+    trigrams: frozenset[bytes]
+    has_pathspecs: bool
+
+
+def _parse_grep_args(grep_args: Sequence[str]) -> _GrepArgs | None:
+    patterns = []
+    positional = []
+    pathspecs: tuple[str, ...] = ()
+    fixed = ignore_case = False
+
+    args = iter(grep_args)
+    for arg in args:
+        if arg == '--':
+            pathspecs = tuple(args)
+        elif arg == '-e':
+            patterns.append(next(args, ''))
+        elif arg in _FIXED:
+            fixed = True
+        elif arg in _REGEX:
+            fixed = False
+        elif arg in _IGNORE_CASE:
+            ignore_case = True
+        elif arg in _FLAGS or arg.startswith('--color'):
+            pass
+        elif arg.startswith('-') and not arg.startswith('--') and arg != '-':
+            for c in arg[1:]:
+                if c == 'F':
+                    fixed = True
+                elif c in 'EGP':
+                    fixed = False
+                elif c == 'i':
+                    ignore_case = True
+                elif c not in _SHORT_FLAGS:
+                    return None
+        elif arg.startswith('-'):
+            return None
+        else:
+            positional.append(arg)
+
+    if not patterns and positional:
+        patterns.append(positional.pop(0))
+    # additional positional arguments may be revisions, bail
+    if len(patterns) != 1 or positional:
+        return None
+
+    pattern, = patterns
+    # newlines separate multiple (alternative) patterns
+    if '\n' in pattern:
+        return None
+    # bytes.lower() only folds ascii, `git grep -i` folds more than that
+    if ignore_case and not pattern.isascii():
+        return None
+
+    pattern_b = pattern.encode()
+    runs = [pattern_b] if fixed else _literal_runs(pattern_b)
+    # any subset of the trigrams is sufficient to prune
+    trigrams = sorted({tri for run in runs for tri in _trigrams(run)})
+    if not trigrams:
+        return None
+    else:
+        return _GrepArgs(
+            frozenset(trigrams[:MAX_TRIGRAMS]), bool(pathspecs),
+        )
+
+
+class Query(NamedTuple):
+    config: Config
+    trees: dict[str, tuple[str, str]]
+    grep_args: tuple[str, ...]
+    trigrams: frozenset[bytes]
+    has_pathspecs: bool
+
+    def _candidates(self, tree: str) -> list[bytes]:
+        with _connect(self.config) as db:
+            placeholders = ', '.join('?' for _ in self.trigrams)
+            postings = db.execute(
+                f'SELECT ids FROM postings '
+                f'WHERE tree = ? AND trigram IN ({placeholders})',
+                (tree, *self.trigrams),
+            ).fetchall()
+            # a trigram which is missing does not appear in any file
+            if len(postings) == len(self.trigrams):
+                ids = set.intersection(
+                    *(set(array.array('I', ids)) for ids, in postings),
+                )
+            else:
+                ids = set()
+
+            return [
+                filename
+                for file_id, filename, indexed in db.execute(
+                    'SELECT id, path, indexed FROM files WHERE tree = ?',
+                    (tree,),
+                )
+                if not indexed or file_id in ids
+            ]
+
+    def args_for(self, repo: str) -> tuple[str, ...] | None:
+        # `None` indicates that the repository cannot match
+        # the index is only good for the commit which was indexed, the
+        # repository may have moved on (a failed update, a manual pull, ...)
+        head_tree = self.trees.get(repo)
+        path = os.path.join(self.config.output_dir, repo)
+        if head_tree is None or _head_commit(path) != head_tree[0]:
+            return self.grep_args
+
+        _, tree = head_tree
+
+        candidates = self._candidates(tree)
+        if not candidates:
+            return None
+        elif self.has_pathspecs or len(candidates) > MAX_PATHSPECS:
+            return self.grep_args
+        else:
+            sep = () if '--' in self.grep_args else ('--',)
+            return (
+                *self.grep_args, *sep,
+                *(f':(literal){os.fsdecode(f)}' for f in candidates),
+            )
+
+
+def query(config: Config, grep_args: Sequence[str]) -> Query | None:
+    if not os.path.exists(config.index_path):
+        return None
+    parsed = _parse_grep_args(grep_args)
+    if parsed is None:
+        return None
+
+    with _connect(config) as db:
+        db.executescript(_SCHEMA)
+        try:
+            trees = {
+                repo: (head, tree)
+                for repo, head, tree in db.execute(
+                    'SELECT repo, head, tree FROM repos',
+                )
+            }
+        except sqlite3.OperationalError:  # written by an older version
+            return None
+    return Query(
+        config=config,
+        trees=trees,
+        grep_args=tuple(grep_args),
+        trigrams=parsed.trigrams,
+        has_pathspecs=parsed.has_pathspecs,
+    )
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            'Build (or update) a trigram index of the cloned repositories '
+            'used to speed up `all-repos-grep`.  Once built, '
+            '`all-repos-clone` keeps the index up to date.'
+        ),
+        usage='%(prog)s [options]',
+    )
+    cli.add_common_args(parser)
+    cli.add_jobs_arg(parser)
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config_filename)
+    update(config, config.get_cloned_repos(), jobs=args.jobs)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
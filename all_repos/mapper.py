@@ -1,15 +1,24 @@
 from __future__ import annotations
 
+import collections
 import concurrent.futures
 import contextlib
+import functools
+import multiprocessing
 from collections.abc import Callable
 from collections.abc import Generator
 from collections.abc import Iterable
+from typing import Any
 from typing import ContextManager
 from typing import TypeVar
 
 T = TypeVar('T')
 T2 = TypeVar('T2')
+TExecutor = TypeVar('TExecutor', bound=concurrent.futures.Executor)
+
+# workers are not forked: forking while other threads are running (for
+# instance a threaded `find_repos` feeding the pool) can deadlock the child
+_MP_CONTEXT = multiprocessing.get_context('spawn')
 
 
 def exhaust(gen: Iterable[T]) -> None:
@@ -17,6 +26,17 @@ def exhaust(gen: Iterable[T]) -> None:
         pass
 
 
+@contextlib.contextmanager
+def cancel_on_error(ex: TExecutor) -> Generator[TExecutor]:
+    with ex:
+        try:
+            yield ex
+        except BaseException:
+            # (for instance quitting) only the calls already running finish
+            ex.shutdown(cancel_futures=True)
+            raise
+
+
 @contextlib.contextmanager
 def _in_process() -> Generator[
         Callable[[Callable[[T2], T], Iterable[T2]], Iterable[T]],
@@ -41,11 +61,60 @@ def thread_mapper(jobs: int) -> ContextManager[
         return _threads(jobs)
 
 
+def _bounded_map(
+        ex: concurrent.futures.Executor,
+        window: int,
+        func: Callable[[T2], T],
+        iterable: Iterable[T2],
+) -> Generator[T]:
+    # only run `window` calls ahead of the consumer so results stay ordered
+    # without holding every result in memory at once
+    futures: collections.deque[concurrent.futures.Future[T]]
+    futures = collections.deque()
+    for item in iterable:
+        futures.append(ex.submit(func, item))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+@contextlib.contextmanager
+def _threads_bounded(jobs: int) -> Generator[
+        Callable[[Callable[[T2], T], Iterable[T2]], Iterable[T]],
+]:
+    with cancel_on_error(concurrent.futures.ThreadPoolExecutor(jobs)) as ex:
+        yield functools.partial(_bounded_map, ex, jobs * 4)
+
+
+def bounded_thread_mapper(jobs: int) -> ContextManager[
+        Callable[[Callable[[T2], T], Iterable[T2]], Iterable[T]],
+]:
+    if jobs == 1:
+        return _in_process()
+    else:
+        return _threads_bounded(jobs)
+
+
+def process_executor(
+        jobs: int,
+        *,
+        initializer: Callable[..., object] | None = None,
+        initargs: tuple[Any, ...] = (),
+) -> concurrent.futures.ProcessPoolExecutor:
+    return concurrent.futures.ProcessPoolExecutor(
+        jobs,
+        mp_context=_MP_CONTEXT,
+        initializer=initializer,
+        initargs=initargs,
+    )
+
+
 @contextlib.contextmanager
 def _processes(jobs: int) -> Generator[
         Callable[[Callable[[T2], T], Iterable[T2]], Iterable[T]],
 ]:
-    with concurrent.futures.ProcessPoolExecutor(jobs) as ex:
+    with process_executor(jobs) as ex:
         yield ex.map
 
 
@@ -56,3 +125,20 @@ def process_mapper(jobs: int) -> ContextManager[
         return _in_process()
     else:
         return _processes(jobs)
+
+
+@contextlib.contextmanager
+def _processes_bounded(jobs: int) -> Generator[
+        Callable[[Callable[[T2], T], Iterable[T2]], Iterable[T]],
+]:
+    with cancel_on_error(process_executor(jobs)) as ex:
+        yield functools.partial(_bounded_map, ex, jobs * 4)
+
+
+def bounded_process_mapper(jobs: int) -> ContextManager[
+        Callable[[Callable[[T2], T], Iterable[T2]], Iterable[T]],
+]:
+    if jobs == 1:
+        return _in_process()
+    else:
+        return _processes_bounded(jobs)
@@ -9,6 +9,7 @@ from typing import NamedTuple
 
 from all_repos import autofix_lib
 from all_repos import git
+from all_repos import http_pool
 from all_repos.util import hide_api_key_repr
 from all_repos.util import load_api_key
 
@@ -62,7 +63,7 @@ def make_pull_request(
         f'_apis/git/repositories/{repo_slug}/pullrequests?api-version=6.0'
     )
 
-    resp = urllib.request.urlopen(
+    resp = http_pool.urlopen(
         urllib.request.Request(
             pull_request_url, data=data, headers=headers, method='POST',
         ),
@@ -81,7 +81,8 @@ def make_pull_request(
     )
 
 
-def push(settings: Settings, branch_name: str) -> None:
+def push(settings: Settings, branch_name: str) -> str:
     resp = make_pull_request(settings, branch_name)
     url = resp.links['self'][0]['href'] if resp.links else ''
     print(f'Pull request created at {url}')
+    return url
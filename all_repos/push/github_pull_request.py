@@ -66,7 +66,8 @@ def make_pull_request(
     )
 
 
-def push(settings: Settings, branch_name: str) -> None:
+def push(settings: Settings, branch_name: str) -> str:
     resp = make_pull_request(settings, branch_name)
     url = resp.json['html_url']
     print(f'Pull request created at {url}')
+    return url
@@ -26,7 +26,7 @@ class Settings(NamedTuple):
 # https://gitlab.com/gitlab-org/gitlab-ce/issues/64320
 
 
-def push(settings: Settings, branch_name: str) -> None:
+def push(settings: Settings, branch_name: str) -> str:
     headers = {
         'Private-Token': load_api_key(settings),
         'Content-Type': 'application/json',
@@ -61,3 +61,4 @@ def push(settings: Settings, branch_name: str) -> None:
     )
     url = resp.json['web_url']
     print(f'Pull request created at {url}')
+    return url
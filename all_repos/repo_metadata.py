@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import datetime
+from typing import NamedTuple
+
+
+class RepoMetadata(NamedTuple):
+    remote: str
+    default_branch: str | None = None
+    # unix timestamp of the most recent push (or other activity)
+    pushed_at: float | None = None
+    # identifies the repository across renames / transfers
+    repo_id: str | None = None
+
+
+def parse_id(value: object) -> str | None:
+    # ids are numbers for some apis and strings for others
+    return None if value is None else str(value)
+
+
+def parse_timestamp(s: str | None) -> float | None:
+    if s is None:
+        return None
+    # python < 3.11 does not understand the `Z` suffix
+    if s.endswith('Z'):
+        s = f'{s[:-1]}+00:00'
+    return datetime.datetime.fromisoformat(s).timestamp()
+
+
+def remotes(metadata: dict[str, RepoMetadata]) -> dict[str, str]:
+    return {repo: meta.remote for repo, meta in metadata.items()}
@@ -11,33 +11,41 @@ from collections.abc import Sequence
 from identify.identify import tags_from_path
 
 from all_repos import autofix_lib
+from all_repos import mapper
 from all_repos.config import Config
-from all_repos.util import zsplit
+
+
+def _has_files(ls_files_cmd: Sequence[str], repo_dir: str) -> bool:
+    return bool(
+        subprocess.run(
+            ('git', '-C', repo_dir, *ls_files_cmd[1:]),
+            check=True, stdout=subprocess.PIPE,
+        ).stdout,
+    )
 
 
 def find_repos(
         config: Config,
         *,
         ls_files_cmd: Sequence[str],
+        jobs: int = 8,
 ) -> Generator[str]:
-    for repo in config.get_cloned_repos():
-        repo_dir = os.path.join(config.output_dir, repo)
-        if subprocess.run(
-            ('git', '-C', repo_dir, *ls_files_cmd[1:]),
-            check=True, stdout=subprocess.PIPE,
-        ).stdout:
-            yield repo_dir
+    repo_dirs = [
+        os.path.join(config.output_dir, repo)
+        for repo in config.get_cloned_repos()
+    ]
+    func = functools.partial(_has_files, ls_files_cmd)
+    # candidates are yielded as they are found so fixing can start early
+    with mapper.bounded_thread_mapper(jobs) as do_map:
+        for repo_dir, has_files in zip(repo_dirs, do_map(func, repo_dirs)):
+            if has_files:
+                yield repo_dir
 
 
-def apply_fix(
-        *,
-        ls_files_cmd: Sequence[str],
-        sed_cmd: Sequence[str],
-) -> None:
-    filenames_b = zsplit(subprocess.check_output(ls_files_cmd))
-    filenames = [f.decode() for f in filenames_b]
-    filenames = [f for f in filenames if tags_from_path(f) & {'file', 'text'}]
-    autofix_lib.run(*sed_cmd, *filenames)
+def apply_fix(filenames: list[str], *, sed_cmd: Sequence[str]) -> None:
+    filenames = [f for f in filenames if 'text' in tags_from_path(f)]
+    if filenames:
+        autofix_lib.run(*sed_cmd, *filenames)
 
 
 def main(argv: Sequence[str] | None = None) -> int:
@@ -87,15 +95,17 @@ def main(argv: Sequence[str] | None = None) -> int:
 
     repos, config, commit, autofix_settings = autofix_lib.from_cli(
         args,
-        find_repos=functools.partial(find_repos, ls_files_cmd=ls_files_cmd),
+        find_repos=functools.partial(
+            find_repos, ls_files_cmd=ls_files_cmd, jobs=args.jobs,
+        ),
         msg=msg, branch_name=args.branch_name,
     )
 
-    autofix_lib.fix(
+    # the blobs are edited outside of the repository, no checkout is needed
+    autofix_lib.fix_contents(
         repos,
-        apply_fix=functools.partial(
-            apply_fix, ls_files_cmd=ls_files_cmd, sed_cmd=sed_cmd,
-        ),
+        pathspecs=(args.filenames,),
+        edit_files=functools.partial(apply_fix, sed_cmd=sed_cmd),
         config=config, commit=commit, autofix_settings=autofix_settings,
     )
     return 0
@@ -3,8 +3,13 @@ from __future__ import annotations
 import base64
 import json
 import urllib.request
+from typing import Any
 from typing import NamedTuple
 
+from all_repos import http_pool
+from all_repos.repo_metadata import parse_id
+from all_repos.repo_metadata import remotes
+from all_repos.repo_metadata import RepoMetadata
 from all_repos.util import hide_api_key_repr
 from all_repos.util import load_api_key
 
@@ -25,15 +30,33 @@ class Settings(NamedTuple):
         return base64.b64encode(value.encode()).decode()
 
 
-def list_repos(settings: Settings) -> dict[str, str]:
+def _default_branch(repo: dict[str, Any]) -> str | None:
+    ref = repo.get('defaultBranch')
+    if ref is not None and ref.startswith('refs/heads/'):
+        return ref[len('refs/heads/'):]
+    else:
+        return None
+
+
+def list_repos_metadata(settings: Settings) -> dict[str, RepoMetadata]:
     url = (
         f'{settings.base_url}/{settings.organization}/{settings.project}/'
         '_apis/git/repositories?api-version=6.0'
     )
-    resp = urllib.request.urlopen(
+    resp = http_pool.urlopen(
         urllib.request.Request(
             url, headers={'Authorization': f'Basic {settings.auth}'},
         ),
     )
     obj = json.load(resp)
-    return {repo['name']: repo['sshUrl'] for repo in obj['value']}
+    return {
+        repo['name']: RepoMetadata(
+            remote=repo['sshUrl'], default_branch=_default_branch(repo),
+            repo_id=parse_id(repo.get('id')),
+        )
+        for repo in obj['value']
+    }
+
+
+def list_repos(settings: Settings) -> dict[str, str]:
+    return remotes(list_repos_metadata(settings))
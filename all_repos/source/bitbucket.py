@@ -4,6 +4,9 @@ import base64
 from typing import NamedTuple
 
 from all_repos import bitbucket_api
+from all_repos.repo_metadata import parse_id
+from all_repos.repo_metadata import remotes
+from all_repos.repo_metadata import RepoMetadata
 from all_repos.util import hide_api_key_repr
 
 
@@ -21,13 +24,21 @@ class Settings(NamedTuple):
         return hide_api_key_repr(self, key='app_password')
 
 
-def list_repos(settings: Settings) -> dict[str, str]:
+def list_repos_metadata(settings: Settings) -> dict[str, RepoMetadata]:
     repos = bitbucket_api.get_all(
         'https://api.bitbucket.org/2.0/repositories?pagelen=100&role=member',
         headers={'Authorization': f'Basic {settings.auth}'},
     )
 
     return {
-        repo['full_name']: 'git@bitbucket.org:{}.git'.format(repo['full_name'])
+        repo['full_name']: RepoMetadata(
+            remote='git@bitbucket.org:{}.git'.format(repo['full_name']),
+            default_branch=(repo.get('mainbranch') or {}).get('name'),
+            repo_id=parse_id(repo.get('uuid')),
+        )
         for repo in repos
     }
+
+
+def list_repos(settings: Settings) -> dict[str, str]:
+    return remotes(list_repos_metadata(settings))
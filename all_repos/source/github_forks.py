@@ -3,6 +3,8 @@ from __future__ import annotations
 from typing import NamedTuple
 
 from all_repos import github_api
+from all_repos.repo_metadata import remotes
+from all_repos.repo_metadata import RepoMetadata
 from all_repos.util import hide_api_key_repr
 from all_repos.util import load_api_key
 
@@ -22,7 +24,7 @@ class Settings(NamedTuple):
         return hide_api_key_repr(self)
 
 
-def list_repos(settings: Settings) -> dict[str, str]:
+def list_repos_metadata(settings: Settings) -> dict[str, RepoMetadata]:
     repos = []
     to_search = [settings.repo]
 
@@ -35,10 +37,14 @@ def list_repos(settings: Settings) -> dict[str, str]:
         repos.extend(res)
         to_search.extend(repo['full_name'] for repo in res if repo['forks'])
 
-    return github_api.filter_repos(
+    return github_api.filter_repos_metadata(
         repos,
         forks=settings.forks,
         private=settings.private,
         collaborator=settings.collaborator,
         archived=settings.archived,
     )
+
+
+def list_repos(settings: Settings) -> dict[str, str]:
+    return remotes(list_repos_metadata(settings))
@@ -4,6 +4,8 @@ import urllib.parse
 from typing import NamedTuple
 
 from all_repos import gitlab_api
+from all_repos.repo_metadata import remotes
+from all_repos.repo_metadata import RepoMetadata
 from all_repos.util import hide_api_key_repr
 from all_repos.util import load_api_key
 
@@ -25,10 +27,14 @@ LIST_REPOS_URL = (
 )
 
 
-def list_repos(settings: Settings) -> dict[str, str]:
+def list_repos_metadata(settings: Settings) -> dict[str, RepoMetadata]:
     org_escaped = urllib.parse.quote(settings.org, safe='')
     repos = gitlab_api.get_all(
         LIST_REPOS_URL.format(base_url=settings.base_url, org=org_escaped),
         headers={'Private-Token': load_api_key(settings)},
     )
-    return gitlab_api.filter_repos_from_settings(repos, settings)
+    return gitlab_api.filter_repos_metadata_from_settings(repos, settings)
+
+
+def list_repos(settings: Settings) -> dict[str, str]:
+    return remotes(list_repos_metadata(settings))
@@ -10,7 +10,11 @@ def urlopen_side_effect(url_mapping):
 
 
 class FakeResponse(io.BytesIO):
-    def __init__(self, body, *, next_link=None):
+    def __init__(self, body, *, next_link=None, last_link=None):
         super().__init__(body)
-        link = None if next_link is None else f'<{next_link}>; rel="next"'
-        self.headers = {'link': link}
+        links = []
+        if next_link is not None:
+            links.append(f'<{next_link}>; rel="next"')
+        if last_link is not None:
+            links.append(f'<{last_link}>; rel="last"')
+        self.headers = {'link': ', '.join(links) or None}
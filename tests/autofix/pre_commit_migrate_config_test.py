@@ -36,3 +36,15 @@ def test_find_repos(file_config_files):
     clone.main(('--config-filename', str(file_config_files.cfg)))
     ret = find_repos(load_config(str(file_config_files.cfg)))
     assert ret == {str(file_config_files.output_dir.join('repo2'))}
+
+
+def test_find_repos_reads_head(file_config_files):
+    write_file_commit(
+        file_config_files.dir1, '.pre-commit-config.yaml', '[]\n',
+    )
+    clone.main(('--config-filename', str(file_config_files.cfg)))
+    # uncommitted changes in the working directory are not considered
+    repo1 = file_config_files.output_dir.join('repo1')
+    repo1.join('.pre-commit-config.yaml').write('repos: []\n')
+    ret = find_repos(load_config(str(file_config_files.cfg)))
+    assert ret == {str(repo1)}
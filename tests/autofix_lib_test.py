@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import argparse
+import functools
+import json
 import os
 import subprocess
+import tempfile
+import time
 from unittest import mock
 
 import pytest
@@ -74,19 +79,48 @@ def test_repo_context_success(file_config_files, capsys):
     ):
         assert testing.git.revparse('.') == expected_rev
         assert git.remote('.') == file_config_files.dir1
+        tmpdir = os.getcwd()
     out, err = capsys.readouterr()
     assert err == ''
     assert 'Errored' not in out
+    assert not os.path.exists(tmpdir)
+
+
+def test_repo_context_borrows_objects(file_config_files, capsys):
+    repo = file_config_files.output_dir.join('repo1')
+    with autofix_lib.repo_context(str(repo), use_color=False):
+        with open('.git/objects/info/alternates') as f:
+            alternates = f.read().strip()
+        out = subprocess.check_output(('git', 'count-objects', '-v'))
+        counts = dict(line.split(': ') for line in out.decode().splitlines())
+    assert 'Errored' not in capsys.readouterr().out
+    assert os.path.samefile(alternates, repo.join('.git/objects'))
+    # no objects were copied
+    assert counts['count'] == counts['in-pack'] == '0'
+
+
+def test_repo_context_sparse(file_config_files, capsys):
+    repo = file_config_files.output_dir.join('repo2')
+    with autofix_lib.repo_context(
+            str(repo), use_color=False, sparse_paths=('/f',),
+    ):
+        files = sorted(os.listdir())
+        status = subprocess.check_output(('git', 'status', '--porcelain'))
+    assert 'Errored' not in capsys.readouterr().out
+    assert files == ['.git', 'f']
+    assert status == b''
 
 
 def test_repo_context_errors(file_config_files, capsys):
     with autofix_lib.repo_context(
             str(file_config_files.output_dir.join('repo1')), use_color=False,
     ):
+        tmpdir = os.getcwd()
         assert False
     out, err = capsys.readouterr()
     assert 'Errored' in out
     assert 'assert False' in err
+    assert not os.path.exists(tmpdir)
 
 
 def test_interactive_control_c(mock_input, capfd):
@@ -240,6 +274,25 @@ def test_fix_with_limit(file_config_files, capfd):
     assert '-OHELLO\n+ohello\n' not in out
 
 
+def test_fix_with_limit_stops_consuming_repos(file_config_files, capfd):
+    def repos():
+        yield str(file_config_files.output_dir.join('repo1'))
+        raise AssertionError('should not be reached')
+
+    autofix_lib.fix(
+        repos(),
+        apply_fix=lower_case_f,
+        config=load_config(file_config_files.cfg),
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=1, dry_run=True, interactive=False,
+        ),
+    )
+
+    out, _ = capfd.readouterr()
+    assert '-OHAI\n+ohai\n' in out
+
+
 def test_fix_interactive(file_config_files, capfd, mock_input):
     mock_input.set_side_effect('y', 'n')
     autofix_lib.fix(
@@ -259,6 +312,108 @@ def test_fix_interactive(file_config_files, capfd, mock_input):
     assert file_config_files.dir2.join('f').read() == 'OHELLO\n'
 
 
+def test_fix_interactive_in_parallel(file_config_files, capfd, mock_input):
+    mock_input.set_side_effect('n', 'y')
+    autofix_lib.fix(
+        (
+            str(file_config_files.output_dir.join('repo1')),
+            str(file_config_files.output_dir.join('repo2')),
+        ),
+        apply_fix=lower_case_f,
+        config=load_config(file_config_files.cfg),
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=2, color=False, limit=None, dry_run=False, interactive=True,
+        ),
+    )
+
+    assert file_config_files.dir1.join('f').read() == 'OHAI\n'
+    assert file_config_files.dir2.join('f').read() == 'ohello\n'
+
+    # the output of each repository is shown right before its review
+    out, _ = capfd.readouterr()
+    prompt = '***Looks good [y,n,s,q,?]? '
+    first, second, _ = out.split(prompt)
+    assert '-OHAI\n+ohai\n' in first
+    assert '-OHELLO\n+ohello\n' in second
+
+
+def test_fix_interactive_quit_cleans_up(
+        file_config_files, capfd, mock_input, tmp_path,
+):
+    mock_input.set_side_effect('q')
+    tmpdir = tmp_path.joinpath('tmp')
+    tmpdir.mkdir()
+    with mock.patch.object(tempfile, 'tempdir', str(tmpdir)):
+        with pytest.raises(SystemExit):
+            autofix_lib.fix(
+                (
+                    str(file_config_files.output_dir.join('repo1')),
+                    str(file_config_files.output_dir.join('repo2')),
+                ),
+                apply_fix=lower_case_f,
+                config=load_config(file_config_files.cfg),
+                commit=autofix_lib.Commit('message!', 'test-branch', None),
+                autofix_settings=autofix_lib.AutofixSettings(
+                    jobs=2, color=False, limit=None, dry_run=False,
+                    interactive=True,
+                ),
+            )
+
+    assert os.listdir(tmpdir) == []
+    assert file_config_files.dir1.join('f').read() == 'OHAI\n'
+    assert file_config_files.dir2.join('f').read() == 'OHELLO\n'
+
+
+def lower_case_f_slowly(calls):
+    with open(calls, 'a') as f:
+        first = not f.tell()
+        f.write('.')
+    # the first repository is ready for review while the rest are running
+    if not first:
+        time.sleep(1)
+    lower_case_f()
+
+
+def test_fix_interactive_quit_cancels_queued(
+        file_config_files, capfd, mock_input, tmp_path,
+):
+    mock_input.set_side_effect('q')
+    calls = tmp_path.joinpath('calls')
+    with pytest.raises(SystemExit):
+        autofix_lib.fix(
+            (str(file_config_files.output_dir.join('repo1')),) * 20,
+            apply_fix=functools.partial(lower_case_f_slowly, str(calls)),
+            config=load_config(file_config_files.cfg),
+            commit=autofix_lib.Commit('message!', 'test-branch', None),
+            autofix_settings=autofix_lib.AutofixSettings(
+                jobs=4, color=False, limit=None, dry_run=False,
+                interactive=True,
+            ),
+        )
+
+    # the calls already handed to a worker finish, the other 16 queued
+    # ahead of the review do not
+    assert len(calls.read_text()) < 16
+
+
+def test_add_fixer_args_jobs_with_interactive():
+    parser = argparse.ArgumentParser()
+    autofix_lib.add_fixer_args(parser)
+    args = parser.parse_args(('--interactive', '--jobs', '4'))
+    settings = autofix_lib.AutofixSettings.from_cli(args)
+    assert settings.interactive is True
+    assert settings.jobs == 4
+    assert settings.resume is False
+
+
+def test_add_fixer_args_resume():
+    parser = argparse.ArgumentParser()
+    autofix_lib.add_fixer_args(parser)
+    args = parser.parse_args(('--resume',))
+    assert autofix_lib.AutofixSettings.from_cli(args).resume is True
+
+
 def test_autofix_makes_commits(file_config_files, capfd):
     autofix_lib.fix(
         (
@@ -302,6 +457,242 @@ def test_autofix_makes_commits(file_config_files, capfd):
     assert commit.endswith('-OHAI\n+ohai\n')
 
 
+def test_fix_in_parallel(file_config_files, capfd):
+    autofix_lib.fix(
+        (
+            str(file_config_files.output_dir.join('repo1')),
+            str(file_config_files.output_dir.join('repo2')),
+        ),
+        apply_fix=lower_case_f,
+        config=load_config(file_config_files.cfg),
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=2, color=False, limit=None, dry_run=False, interactive=False,
+        ),
+    )
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert 'Errored' not in out
+
+    assert file_config_files.dir1.join('f').read() == 'ohai\n'
+    assert file_config_files.dir2.join('f').read() == 'ohello\n'
+
+
+def test_fix_push_errors(file_config_files, capfd):
+    pushed_from = []
+
+    def push(settings, branch_name):
+        pushed_from.append(os.getcwd())
+        raise AssertionError('nope')
+
+    config = load_config(file_config_files.cfg)._replace(push=push)
+    autofix_lib.fix(
+        (str(file_config_files.output_dir.join('repo1')),),
+        apply_fix=lower_case_f,
+        config=config,
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=False, interactive=False,
+        ),
+    )
+
+    out, err = capfd.readouterr()
+    repo1 = file_config_files.output_dir.join('repo1')
+    assert f'***Errored pushing {repo1}\n' in out
+    assert 'AssertionError: nope' in err
+    # the temporary clone is removed afterwards
+    tmpdir, = pushed_from
+    assert not os.path.exists(tmpdir)
+
+
+def _journal(config):
+    path = os.path.join(config.autofix_journal_dir, 'test-branch.jsonl')
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_fix_writes_journal(file_config_files, capfd):
+    file_config_files.dir1.join('f').write('ohai\n')
+    testing.git.commit(file_config_files.dir1)
+    clone.main(('--config-filename', str(file_config_files.cfg)))
+
+    config = load_config(file_config_files.cfg)
+    repo1 = str(file_config_files.output_dir.join('repo1'))
+    repo2 = str(file_config_files.output_dir.join('repo2'))
+    autofix_lib.fix(
+        (repo1, repo2),
+        apply_fix=lower_case_f,
+        config=config,
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=False, interactive=False,
+        ),
+    )
+
+    assert _journal(config) == [
+        {'repo': repo1, 'status': 'no-diff', 'url': None},
+        {'repo': repo2, 'status': 'pushed', 'url': None},
+    ]
+
+
+def lower_case_f_once_pushed(*, journal, first_remote):
+    # the other repository is only fixed once the first push is journaled
+    if git.remote('.') != first_remote:
+        for _ in range(200):
+            with open(journal) as f:
+                if '"pushed"' in f.read():
+                    break
+            time.sleep(.05)
+        else:
+            raise AssertionError('the first push was not journaled')
+    lower_case_f()
+
+
+def test_fix_journal_written_while_running(file_config_files, capfd):
+    config = load_config(file_config_files.cfg)
+    repo1 = str(file_config_files.output_dir.join('repo1'))
+    repo2 = str(file_config_files.output_dir.join('repo2'))
+    apply_fix = functools.partial(
+        lower_case_f_once_pushed,
+        journal=os.path.join(config.autofix_journal_dir, 'test-branch.jsonl'),
+        first_remote=str(file_config_files.dir1),
+    )
+    autofix_lib.fix(
+        (repo1, repo2),
+        apply_fix=apply_fix,
+        config=config,
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=2, color=False, limit=None, dry_run=False, interactive=False,
+        ),
+    )
+
+    out, _ = capfd.readouterr()
+    assert 'Errored' not in out
+    assert _journal(config) == [
+        {'repo': repo1, 'status': 'pushed', 'url': None},
+        {'repo': repo2, 'status': 'pushed', 'url': None},
+    ]
+
+
+def test_fix_journal_records_errors(file_config_files, capfd):
+    config = load_config(file_config_files.cfg)
+    repo1 = str(file_config_files.output_dir.join('repo1'))
+    autofix_lib.fix(
+        (repo1,),
+        apply_fix=lower_case_f,
+        check_fix=failing_check_fix,
+        config=config,
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=False, interactive=False,
+        ),
+    )
+
+    assert _journal(config) == [
+        {'repo': repo1, 'status': 'errored', 'url': None},
+    ]
+
+
+def test_fix_dry_run_does_not_write_journal(file_config_files, capfd):
+    config = load_config(file_config_files.cfg)
+    autofix_lib.fix(
+        (str(file_config_files.output_dir.join('repo1')),),
+        apply_fix=lower_case_f,
+        config=config,
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=True, interactive=False,
+        ),
+    )
+
+    assert not os.path.exists(config.autofix_journal_dir)
+
+
+def test_fix_resume(file_config_files, capfd):
+    config = load_config(file_config_files.cfg)
+    repo1 = str(file_config_files.output_dir.join('repo1'))
+    repo2 = str(file_config_files.output_dir.join('repo2'))
+    os.makedirs(config.autofix_journal_dir)
+    journal = os.path.join(config.autofix_journal_dir, 'test-branch.jsonl')
+    with open(journal, 'w') as f:
+        f.write(f'{{"repo": "{repo1}", "status": "pushed", "url": null}}\n')
+        f.write(f'{{"repo": "{repo2}", "status": "errored", "url": null}}\n')
+        # a partial entry from an interrupted run
+        f.write('{"repo": "')
+
+    autofix_lib.fix(
+        (repo1, repo2),
+        apply_fix=lower_case_f,
+        config=config,
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=False, interactive=False,
+            resume=True,
+        ),
+    )
+
+    # the completed repository is skipped, the errored one is retried
+    assert file_config_files.dir1.join('f').read() == 'OHAI\n'
+    assert file_config_files.dir2.join('f').read() == 'ohello\n'
+    with open(journal) as f:
+        *_, last = f
+    assert json.loads(last) == {'repo': repo2, 'status': 'pushed', 'url': None}
+
+
+def test_fix_resume_complete_journal(file_config_files, capfd):
+    config = load_config(file_config_files.cfg)
+    repo1 = str(file_config_files.output_dir.join('repo1'))
+    repo2 = str(file_config_files.output_dir.join('repo2'))
+    os.makedirs(config.autofix_journal_dir)
+    journal = os.path.join(config.autofix_journal_dir, 'test-branch.jsonl')
+    with open(journal, 'w') as f:
+        f.write(f'{{"repo": "{repo1}", "status": "pushed", "url": null}}\n')
+
+    autofix_lib.fix(
+        (repo1, repo2),
+        apply_fix=lower_case_f,
+        config=config,
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=False, interactive=False,
+            resume=True,
+        ),
+    )
+
+    # no blank line is inserted after a complete entry
+    with open(journal) as f:
+        assert [json.loads(line) for line in f] == [
+            {'repo': repo1, 'status': 'pushed', 'url': None},
+            {'repo': repo2, 'status': 'pushed', 'url': None},
+        ]
+
+
+def test_fix_sparse(file_config_files, capfd):
+    autofix_lib.fix(
+        (str(file_config_files.output_dir.join('repo2')),),
+        apply_fix=lower_case_f,
+        config=load_config(file_config_files.cfg),
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=False, interactive=False,
+        ),
+        sparse_paths=('/f',),
+    )
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert 'Errored' not in out
+
+    assert file_config_files.dir2.join('f').read() == 'ohello\n'
+    # files outside of the sparse checkout are untouched
+    files = subprocess.check_output((
+        'git', '-C', file_config_files.dir2, 'ls-files',
+    ))
+    assert files == b'f\nf2\n'
+
+
 def test_fix_failing_check_no_changes(file_config_files, capfd):
     autofix_lib.fix(
         (
@@ -362,3 +753,156 @@ def test_fix_non_default_branch(file_config_non_default):
     )
 
     assert file_config_non_default.dir1.join('f').read() == 'ohai\n'
+
+
+def lower_case_f_contents(filenames):
+    # only the matching files are present, outside of any repository
+    assert sorted(os.listdir()) == sorted(filenames)
+    lower_case_contents(filenames)
+
+
+def test_fix_contents_makes_commits(file_config_files, capfd):
+    autofix_lib.fix_contents(
+        (
+            str(file_config_files.output_dir.join('repo1')),
+            str(file_config_files.output_dir.join('repo2')),
+        ),
+        pathspecs=('f',),
+        edit_files=lower_case_f_contents,
+        config=load_config(file_config_files.cfg),
+        commit=autofix_lib.Commit('message!', 'test-branch', 'A B <a@a.a>'),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=False, interactive=False,
+        ),
+    )
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert 'Errored' not in out
+    assert '-OHAI\n+ohai\n' in out
+
+    assert file_config_files.dir1.join('f').read() == 'ohai\n'
+    assert file_config_files.dir2.join('f').read() == 'ohello\n'
+    commit = subprocess.check_output((
+        'git', '-C', file_config_files.dir2, 'log',
+        '--patch', '--grep', 'message!', '--format=%an %ae\n%B',
+    )).decode()
+    assert commit.startswith('A B a@a.a\nmessage!\n')
+    assert commit.endswith('-OHELLO\n+ohello\n')
+
+
+def test_fix_contents_unusual_filenames(file_config_files):
+    names = ('d/g', 'a "quoted"\nname', 'back\\slash')
+    for name in names:
+        file_config_files.dir1.join(name).write('OHAI\n', ensure=True)
+    testing.git.commit(file_config_files.dir1)
+    clone.main(('--config-filename', str(file_config_files.cfg)))
+
+    autofix_lib.fix_contents(
+        (str(file_config_files.output_dir.join('repo1')),),
+        pathspecs=names,
+        edit_files=lower_case_contents,
+        config=load_config(file_config_files.cfg),
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=False, interactive=False,
+        ),
+    )
+
+    for name in names:
+        assert file_config_files.dir1.join(name).read() == 'ohai\n'
+    assert file_config_files.dir1.join('f').read() == 'OHAI\n'
+
+
+def lower_case_only_f(filenames):
+    lower_case_contents([name for name in filenames if name == 'f'])
+
+
+def test_fix_contents_line_endings_untouched(file_config_files, monkeypatch):
+    file_config_files.dir1.join('crlf').write_binary(b'ohai\r\n')
+    testing.git.commit(file_config_files.dir1)
+    clone.main(('--config-filename', str(file_config_files.cfg)))
+    monkeypatch.setenv('GIT_CONFIG_COUNT', '1')
+    monkeypatch.setenv('GIT_CONFIG_KEY_0', 'core.autocrlf')
+    monkeypatch.setenv('GIT_CONFIG_VALUE_0', 'input')
+
+    autofix_lib.fix_contents(
+        (str(file_config_files.output_dir.join('repo1')),),
+        pathspecs=('f', 'crlf'),
+        edit_files=lower_case_only_f,
+        config=load_config(file_config_files.cfg),
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=False, interactive=False,
+        ),
+    )
+
+    changed = subprocess.check_output((
+        'git', '-C', file_config_files.dir1, 'diff', '--name-only',
+        'HEAD^', 'HEAD',
+    )).decode()
+    assert changed == 'f\n'
+    assert file_config_files.dir1.join('crlf').read_binary() == b'ohai\r\n'
+
+
+def test_fix_contents_dry_run_no_change(file_config_files, capfd):
+    autofix_lib.fix_contents(
+        (str(file_config_files.output_dir.join('repo1')),),
+        pathspecs=('f',),
+        edit_files=lower_case_f_contents,
+        config=load_config(file_config_files.cfg),
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=True, interactive=False,
+        ),
+    )
+
+    out, _ = capfd.readouterr()
+    assert '-OHAI\n+ohai\n' in out
+    assert file_config_files.dir1.join('f').read() == 'OHAI\n'
+
+
+def test_fix_contents_unchanged(file_config_files, capfd):
+    rev = testing.git.revparse(file_config_files.dir2)
+    autofix_lib.fix_contents(
+        (str(file_config_files.output_dir.join('repo2')),),
+        pathspecs=('f2',),
+        edit_files=lower_case_f_contents,
+        config=load_config(file_config_files.cfg),
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=False, interactive=False,
+        ),
+    )
+
+    out, _ = capfd.readouterr()
+    assert 'Errored' not in out
+    assert testing.git.revparse(file_config_files.dir2) == rev
+
+
+def lower_case_contents(filenames):
+    for filename in filenames:
+        with open(filename) as f:
+            contents = f.read()
+        with open(filename, 'w') as f:
+            f.write(contents.lower())
+
+
+def test_fix_contents_interactive(file_config_files, capfd, mock_input):
+    mock_input.set_side_effect('y', 'n')
+    autofix_lib.fix_contents(
+        (
+            str(file_config_files.output_dir.join('repo1')),
+            str(file_config_files.output_dir.join('repo2')),
+        ),
+        pathspecs=('f',),
+        edit_files=lower_case_contents,
+        config=load_config(file_config_files.cfg),
+        commit=autofix_lib.Commit('message!', 'test-branch', None),
+        autofix_settings=autofix_lib.AutofixSettings(
+            jobs=1, color=False, limit=None, dry_run=False, interactive=True,
+        ),
+    )
+
+    assert file_config_files.dir1.join('f').read() == 'ohai\n'
+    assert file_config_files.dir2.join('f').read() == 'OHELLO\n'
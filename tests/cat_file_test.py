@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import subprocess
+
+import pytest
+
+from all_repos import cat_file
+from testing.git import init_repo
+from testing.git import write_file_commit
+
+
+@pytest.fixture
+def repo(tmpdir):
+    init_repo(tmpdir)
+    tmpdir.join('d').ensure_dir()
+    tmpdir.join('d/f').write('hello\n')
+    tmpdir.join('x').write('#!/bin/sh\n')
+    tmpdir.join('x').chmod(0o755)
+    tmpdir.join('link').mksymlinkto('x')
+    write_file_commit(tmpdir, 'a b', '\0binary\n')
+    return tmpdir
+
+
+def test_read_blob(repo):
+    with cat_file.batch(str(repo)) as batch:
+        assert batch.read_blob('a b') == b'\0binary\n'
+        assert batch.read_blob('d/f') == b'hello\n'
+        assert batch.read_blob('missing') is None
+        # not a blob
+        assert batch.read_blob('d') is None
+
+
+def test_read_blob_rev(repo):
+    write_file_commit(repo, 'd/f', 'changed\n')
+    with cat_file.batch(str(repo)) as batch:
+        assert batch.read_blob('d/f') == b'changed\n'
+        assert batch.read_blob('d/f', rev='HEAD^') == b'hello\n'
+
+
+def test_read(repo):
+    sha = subprocess.check_output(
+        ('git', '-C', repo, 'rev-parse', 'HEAD:d/f'),
+    ).decode().strip()
+    with cat_file.batch(str(repo)) as batch:
+        assert batch.read(sha) == b'hello\n'
+        with pytest.raises(KeyError):
+            batch.read('0' * 40)
+        # the process is still usable after a missing object
+        assert batch.read(sha) == b'hello\n'
+
+
+def test_read_newline(repo):
+    with cat_file.batch(str(repo)) as batch:
+        with pytest.raises(ValueError):
+            batch.read_blob('a\nb')
+
+
+def test_ls_tree(repo):
+    out = subprocess.check_output(('git', '-C', repo, 'ls-tree', '-z', 'HEAD'))
+    expected = []
+    for entry in out.rstrip(b'\0').split(b'\0'):
+        info, _, name = entry.partition(b'\t')
+        mode, tp, sha = info.decode().split()
+        expected.append(cat_file.TreeEntry(mode, tp, sha, name))
+
+    with cat_file.batch(str(repo)) as batch:
+        ret = batch.ls_tree()
+    assert ret == expected
+    assert {entry.name for entry in ret} == {b'a b', b'd', b'link', b'x'}
+
+
+def test_ls_tree_subdirectory(repo):
+    with cat_file.batch(str(repo)) as batch:
+        ret = batch.ls_tree('d')
+        assert ret is not None
+        (entry,) = ret
+        assert entry.name == b'f'
+        assert entry.type == 'blob'
+        assert batch.ls_tree('missing') is None
+        assert batch.ls_tree('d/f') is None
+
+
+def test_ls_tree_submodule():
+    contents = b'160000 sub\0' + bytes(range(20))
+    assert cat_file._parse_tree(contents, 20) == [
+        cat_file.TreeEntry('160000', 'commit', bytes(range(20)).hex(), b'sub'),
+    ]
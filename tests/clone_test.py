@@ -1,10 +1,18 @@
 from __future__ import annotations
 
 import json
+import os
 import subprocess
+import time
+from unittest import mock
 
+import all_repos.source.json_file
+from all_repos import clone
+from all_repos import git
 from all_repos.clone import main
+from all_repos.repo_metadata import RepoMetadata
 from testing.git import revparse
+from testing.git import write_file_commit
 
 
 def test_it_clones(file_config):
@@ -24,6 +32,90 @@ def test_it_clones(file_config):
     assert revparse(file_config.output_dir.join('repo2')) == file_config.rev2
 
 
+def _fetches(check_call):
+    return [c for c in check_call.call_args_list if 'fetch' in c[0][0]]
+
+
+def test_it_skips_fetching_unchanged_repos(file_config):
+    assert not main(('--config-file', str(file_config.cfg)))
+
+    with mock.patch.object(
+            subprocess, 'check_call', wraps=subprocess.check_call,
+    ) as check_call:
+        assert not main(('--config-file', str(file_config.cfg)))
+    assert _fetches(check_call) == []
+
+    subprocess.check_call((
+        'git', '-C', file_config.dir1, 'commit', '--allow-empty', '-m', 'foo',
+    ))
+    with mock.patch.object(
+            subprocess, 'check_call', wraps=subprocess.check_call,
+    ) as check_call:
+        assert not main(('--config-file', str(file_config.cfg)))
+    fetch_dir, = {call[0][0][2] for call in _fetches(check_call)}
+    assert fetch_dir == file_config.output_dir.join('repo1')
+    assert revparse(fetch_dir) == revparse(file_config.dir1)
+
+
+def _metadata_source(file_config, *, pushed_at):
+    def list_repos_metadata(settings):
+        return {
+            'repo1': RepoMetadata(
+                str(file_config.dir1), default_branch='main',
+                pushed_at=pushed_at,
+            ),
+            'repo2': RepoMetadata(str(file_config.dir2)),
+        }
+    return mock.patch.object(
+        all_repos.source.json_file, 'list_repos_metadata',
+        list_repos_metadata, create=True,
+    )
+
+
+def test_it_uses_source_metadata(file_config):
+    with _metadata_source(file_config, pushed_at=time.time()):
+        with mock.patch.object(
+                clone, '_ls_remote', wraps=clone._ls_remote,
+        ) as ls_remote:
+            assert not main(('--config-file', str(file_config.cfg)))
+    # the default branch is known for repo1 so ls-remote is only needed once
+    ls_remote.assert_called_once_with(
+        str(file_config.dir2), all_branches=False,
+    )
+    assert revparse(file_config.output_dir.join('repo1')) == file_config.rev1
+
+
+def test_it_skips_unchanged_repos_with_only_default_branch(file_config):
+    with _metadata_source(file_config, pushed_at=None):
+        assert not main(('--config-file', str(file_config.cfg)))
+
+    # without `pushed_at` the ls-remote digest still detects no changes
+    with _metadata_source(file_config, pushed_at=None):
+        with mock.patch.object(
+                subprocess, 'check_call', wraps=subprocess.check_call,
+        ) as check_call:
+            assert not main(('--config-file', str(file_config.cfg)))
+    assert check_call.call_args_list == []
+
+
+def test_it_skips_repos_not_pushed_since_last_fetch(file_config):
+    with _metadata_source(file_config, pushed_at=0):
+        assert not main(('--config-file', str(file_config.cfg)))
+
+    subprocess.check_call((
+        'git', '-C', file_config.dir1, 'commit', '--allow-empty', '-m', 'foo',
+    ))
+    with _metadata_source(file_config, pushed_at=0):
+        assert not main(('--config-file', str(file_config.cfg)))
+    # the source claimed nothing has been pushed, so it was not fetched
+    assert revparse(file_config.output_dir.join('repo1')) == file_config.rev1
+
+    with _metadata_source(file_config, pushed_at=time.time()):
+        assert not main(('--config-file', str(file_config.cfg)))
+    new_rev = revparse(file_config.dir1)
+    assert revparse(file_config.output_dir.join('repo1')) == new_rev
+
+
 def test_it_does_not_crash_with_no_repos(file_config):
     cfg = json.loads(file_config.cfg.read())
     cfg['include'] = '^$'
@@ -52,6 +144,33 @@ def test_it_removes_directories(file_config):
     file_config.repos_json.write(new_contents)
     assert not main(('--config-file', str(file_config.cfg)))
     assert not file_config.output_dir.join('repo1').exists()
+    assert not file_config.output_dir.join('.all-repos-trash').exists()
+
+
+def test_it_removes_across_filesystems(file_config):
+    assert not main(('--config-file', str(file_config.cfg)))
+
+    new_contents = json.dumps({'repo2': str(file_config.dir2)})
+    file_config.repos_json.write(new_contents)
+    with mock.patch.object(os, 'rename', side_effect=OSError):
+        assert not main(('--config-file', str(file_config.cfg)))
+    assert not file_config.output_dir.join('repo1').exists()
+
+
+def test_it_empties_trash_left_behind(file_config, capsys):
+    assert not main(('--config-file', str(file_config.cfg)))
+    # an interrupted run: the trash was not emptied, there is no manifest
+    trash = file_config.output_dir.join('.all-repos-trash')
+    file_config.output_dir.join('repo1').copy(trash.join('tmp/repo'))
+    file_config.output_dir.join('repos_filtered.json').remove()
+    capsys.readouterr()
+
+    assert not main(('--config-file', str(file_config.cfg)))
+
+    out, _ = capsys.readouterr()
+    assert 'Removing' not in out
+    assert not trash.exists()
+    assert file_config.output_dir.join('repo1').isdir()
 
 
 def test_it_removes_empty_directories(file_config):
@@ -126,6 +245,166 @@ def test_clones_all_branches_true(file_config):
     assert branch_out == "'origin/HEAD'\n'origin/b2'\n'origin/main'\n"
 
 
+def test_it_uses_the_previous_run_to_find_repos(file_config):
+    assert not main(('--config-file', str(file_config.cfg)))
+    # a repository which went missing is cloned again
+    file_config.output_dir.join('repo2').remove()
+
+    with mock.patch.object(clone, '_get_current_state_helper') as helper:
+        assert not main(('--config-file', str(file_config.cfg)))
+    helper.assert_not_called()
+    assert revparse(file_config.output_dir.join('repo2')) == file_config.rev2
+
+
+def _rename_repo1(file_config, tmpdir):
+    # the same repository, available at a new remote
+    renamed = tmpdir.join('renamed')
+    subprocess.check_call((
+        'git', 'clone', '--quiet', file_config.dir1, renamed,
+    ))
+    file_config.repos_json.write(
+        json.dumps({
+            'a/renamed': str(renamed), 'repo2': str(file_config.dir2),
+        }),
+    )
+    return renamed
+
+
+def test_it_updates_changed_remotes(file_config, tmpdir, capsys):
+    assert not main(('--config-file', str(file_config.cfg)))
+    file_config.output_dir.join('repo1/.git/marker').ensure()
+    new_remote = tmpdir.join('new-remote')
+    subprocess.check_call((
+        'git', 'clone', '--quiet', file_config.dir1, new_remote,
+    ))
+    write_file_commit(new_remote, 'f', 'hello\n')
+    file_config.repos_json.write(
+        json.dumps({'repo1': str(new_remote), 'repo2': str(file_config.dir2)}),
+    )
+    capsys.readouterr()
+
+    assert not main(('--config-file', str(file_config.cfg)))
+
+    out, _ = capsys.readouterr()
+    assert 'Updating remote of repo1\n' in out
+    assert 'Removing' not in out
+    assert 'Initializing' not in out
+    repo1 = file_config.output_dir.join('repo1')
+    assert repo1.join('.git/marker').exists()
+    assert git.remote(repo1) == new_remote
+    assert revparse(repo1) == revparse(new_remote)
+
+
+def test_it_moves_renamed_repos(file_config, tmpdir, capsys):
+    assert not main(('--config-file', str(file_config.cfg)))
+    file_config.output_dir.join('repo1/.git/marker').ensure()
+    renamed = _rename_repo1(file_config, tmpdir)
+    capsys.readouterr()
+
+    assert not main(('--config-file', str(file_config.cfg)))
+
+    out, _ = capsys.readouterr()
+    assert 'Moving repo1 to a/renamed\n' in out
+    assert 'Initializing' not in out
+    assert not file_config.output_dir.join('repo1').exists()
+    moved = file_config.output_dir.join('a/renamed')
+    assert moved.join('.git/marker').exists()
+    assert git.remote(moved) == renamed
+    assert revparse(moved) == file_config.rev1
+
+
+def test_it_moves_renamed_repos_by_id(file_config, tmpdir, capsys):
+    def _source(repo_id):
+        def list_repos_metadata(settings):
+            repos = all_repos.source.json_file.list_repos(settings)
+            return {
+                k: RepoMetadata(v, repo_id=repo_id if k != 'repo2' else '2')
+                for k, v in repos.items()
+            }
+        return mock.patch.object(
+            all_repos.source.json_file, 'list_repos_metadata',
+            list_repos_metadata, create=True,
+        )
+
+    with _source('1'):
+        assert not main(('--config-file', str(file_config.cfg)))
+    _rename_repo1(file_config, tmpdir)
+    capsys.readouterr()
+
+    # a different id: this is not the same repository
+    with _source('3'):
+        assert not main(('--config-file', str(file_config.cfg)))
+    out, _ = capsys.readouterr()
+    assert 'Removing repo1\n' in out
+    assert 'Initializing a/renamed\n' in out
+
+    # rename it once more, this time keeping the id
+    file_config.repos_json.write(
+        json.dumps({
+            'b/renamed': str(tmpdir.join('renamed')),
+            'repo2': str(file_config.dir2),
+        }),
+    )
+    with _source('3'):
+        assert not main(('--config-file', str(file_config.cfg)))
+    out, _ = capsys.readouterr()
+    assert 'Moving a/renamed to b/renamed\n' in out
+    assert not file_config.output_dir.join('a').exists()
+
+
+def _set_config(file_config, **kwargs):
+    cfg_contents = json.loads(file_config.cfg.read())
+    cfg_contents.update(kwargs)
+    file_config.cfg.write(json.dumps(cfg_contents))
+
+
+def test_clone_filter(file_config):
+    write_file_commit(file_config.dir1, 'f', 'old\n')
+    write_file_commit(file_config.dir1, 'f', 'new\n')
+    subprocess.check_call((
+        'git', '-C', file_config.dir1, 'config', 'uploadpack.allowFilter', '1',
+    ))
+    _set_config(file_config, clone_filter='blob:none')
+
+    assert not main(('--config-file', str(file_config.cfg)))
+
+    repo1 = file_config.output_dir.join('repo1')
+    assert repo1.join('f').read() == 'new\n'
+    promisor = subprocess.check_output((
+        'git', '-C', repo1, 'config', 'remote.origin.promisor',
+    ))
+    assert promisor == b'true\n'
+    # blobs which are not checked out were not fetched
+    objects = subprocess.check_output((
+        'git', '-C', repo1, 'rev-list', '--objects', '--all',
+        '--missing=print',
+    )).decode()
+    assert any(line.startswith('?') for line in objects.splitlines())
+
+
+def test_clone_depth(file_config):
+    write_file_commit(file_config.dir1, 'f', 'hello\n')
+    _set_config(file_config, depth=1)
+
+    assert not main(('--config-file', str(file_config.cfg)))
+
+    def _count_commits():
+        return subprocess.check_output((
+            'git', '-C', file_config.output_dir.join('repo1'),
+            'rev-list', '--count', 'HEAD',
+        ))
+
+    assert _count_commits() == b'1\n'
+
+    # later fetches keep the clone shallow
+    write_file_commit(file_config.dir1, 'f', 'world\n')
+    assert not main(('--config-file', str(file_config.cfg)))
+    assert revparse(file_config.output_dir.join('repo1')) == revparse(
+        file_config.dir1,
+    )
+    assert _count_commits() == b'1\n'
+
+
 def test_it_sorts_filtered_repos(file_config):
     # make the repos json out of order
     contents = json.loads(file_config.repos_json.read())
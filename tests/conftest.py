@@ -4,12 +4,12 @@ import builtins
 import json
 import subprocess
 import sys
-import urllib.request
 from unittest import mock
 
 import pytest
 
 from all_repos import clone
+from all_repos import http_pool
 from testing.auto_namedtuple import auto_namedtuple
 from testing.git import init_repo
 from testing.git import write_file_commit
@@ -17,7 +17,7 @@ from testing.git import write_file_commit
 
 @pytest.fixture
 def mock_urlopen():
-    with mock.patch.object(urllib.request, 'urlopen') as mck:
+    with mock.patch.object(http_pool, 'urlopen') as mck:
         yield mck
 
 
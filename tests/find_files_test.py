@@ -1,6 +1,21 @@
 from __future__ import annotations
 
+import json
+import os.path
+import subprocess
+from unittest import mock
+
+import pytest
+
+from all_repos import clone
+from all_repos import find_files as find_files_mod
+from all_repos.config import load_config
+from all_repos.find_files import _index_key
+from all_repos.find_files import CACHE_FILE
+from all_repos.find_files import find_files
+from all_repos.find_files import ls_files
 from all_repos.find_files import main
+from testing.git import write_file_commit
 
 
 def test_find_files(file_config_files, capsys):
@@ -40,3 +55,143 @@ def test_find_files_repos_not_matching(file_config_files, capsys):
     assert main(('-C', str(file_config_files.cfg), '--repos', 'g'))
     out, _ = capsys.readouterr()
     assert not out
+
+
+def test_find_files_jobs(file_config_files, capsys):
+    assert not main((
+        '-C', str(file_config_files.cfg), '--color=never', '-j2', r'f',
+    ))
+    out, _ = capsys.readouterr()
+    assert out == '{}:f\n{}:f\n{}:f2\n'.format(
+        file_config_files.output_dir.join('repo1'),
+        file_config_files.output_dir.join('repo2'),
+        file_config_files.output_dir.join('repo2'),
+    )
+
+
+def test_clone_writes_cache(file_config_files):
+    cache = file_config_files.output_dir.join('repo2/.git', CACHE_FILE)
+    key, _, files = cache.read_binary().partition(b'\n')
+    assert key == _index_key(str(file_config_files.output_dir.join('repo2')))
+    assert files == b'f\0f2\0'
+
+
+def test_ls_files_uses_cache(file_config_files):
+    config = load_config(str(file_config_files.cfg))
+    repo = file_config_files.output_dir.join('repo1')
+    cache = repo.join('.git', CACHE_FILE)
+    key, _, _ = cache.read_binary().partition(b'\n')
+    cache.write_binary(key + b'\ncached\0')
+    assert ls_files(config, 'repo1') == (str(repo), [b'cached'])
+
+
+def test_ls_files_cache_outdated(file_config_files):
+    config = load_config(str(file_config_files.cfg))
+    repo = file_config_files.output_dir.join('repo1')
+    repo.join('g').write('')
+    subprocess.check_call(('git', '-C', repo, 'add', 'g'))
+    assert ls_files(config, 'repo1') == (str(repo), [b'f', b'g'])
+    key, _, _ = repo.join('.git', CACHE_FILE).read_binary().partition(b'\n')
+    assert key == _index_key(str(repo))
+
+
+def test_ls_files_no_index(file_config_files):
+    config = load_config(str(file_config_files.cfg))
+    repo = file_config_files.output_dir.join('repo1')
+    repo.join('.git/index').remove()
+    repo.join('.git', CACHE_FILE).remove()
+    assert ls_files(config, 'repo1') == (str(repo), [])
+    assert not repo.join('.git', CACHE_FILE).exists()
+
+
+def _find_files(file_config_files, pattern):
+    config = load_config(str(file_config_files.cfg))
+    ret = find_files(config, pattern)
+    return {
+        os.path.relpath(k, file_config_files.output_dir): v
+        for k, v in ret.items()
+    }
+
+
+@pytest.fixture
+def no_ls_files():
+    with mock.patch.object(
+            find_files_mod, '_matching_files',
+            side_effect=AssertionError('should use the catalog'),
+    ):
+        yield
+
+
+def test_clone_writes_catalog(file_config_files):
+    key1 = _index_key(str(file_config_files.output_dir.join('repo1')))
+    key2 = _index_key(str(file_config_files.output_dir.join('repo2')))
+    assert key1 is not None and key2 is not None
+    catalog = file_config_files.output_dir.join('.all-repos-files')
+    header, _, paths = catalog.read_binary().partition(b'\n')
+    assert json.loads(header) == {
+        'repos': [
+            ['repo1', key1.decode(), 0, 2],
+            ['repo2', key2.decode(), 2, 7],
+        ],
+    }
+    assert paths == b'f\nf\nf2\n'
+
+
+@pytest.mark.parametrize(
+    ('pattern', 'expected'),
+    (
+        ('f', {'repo1': [b'f'], 'repo2': [b'f', b'f2']}),
+        ('^f$', {'repo1': [b'f'], 'repo2': [b'f']}),
+        (r'\d$', {'repo2': [b'f2']}),
+        ('$', {'repo1': [b'f'], 'repo2': [b'f', b'f2']}),
+        # candidates which span multiple paths are rejected
+        (r'f\sf', {}),
+        ('(?s)f.f', {}),
+        ('g', {}),
+    ),
+)
+def test_find_files_catalog(file_config_files, no_ls_files, pattern, expected):
+    assert _find_files(file_config_files, pattern) == expected
+
+
+@pytest.mark.parametrize(
+    ('pattern', 'expected'),
+    (
+        (r'\Af2\Z', {'repo2': [b'f2']}),
+        (r'^f(?!\W)', {'repo1': [b'f'], 'repo2': [b'f', b'f2']}),
+        (r'(?<!\w)f$', {'repo1': [b'f'], 'repo2': [b'f']}),
+        (r'f(?=\Z)', {'repo1': [b'f'], 'repo2': [b'f']}),
+    ),
+)
+def test_find_files_catalog_not_used_for_anchors_and_lookarounds(
+        file_config_files, pattern, expected,
+):
+    with mock.patch.object(find_files_mod._Catalog, 'search') as search:
+        assert _find_files(file_config_files, pattern) == expected
+    search.assert_not_called()
+
+
+def test_find_files_catalog_outdated(file_config_files):
+    repo = file_config_files.output_dir.join('repo1')
+    repo.join('g').write('')
+    subprocess.check_call(('git', '-C', repo, 'add', 'g'))
+    assert _find_files(file_config_files, '^[fg]$') == {
+        'repo1': [b'f', b'g'],
+        'repo2': [b'f'],
+    }
+
+
+def test_find_files_catalog_newline_in_filename(file_config_files):
+    write_file_commit(file_config_files.dir1, 'a\nf', '')
+    clone.main(('--config-filename', str(file_config_files.cfg)))
+    # would match the first "line" of the path if it were in the catalog
+    assert _find_files(file_config_files, '^a$') == {}
+    assert _find_files(file_config_files, 'f$') == {
+        'repo1': [b'a\nf', b'f'],
+        'repo2': [b'f'],
+    }
+
+
+def test_find_files_without_catalog(file_config_files):
+    file_config_files.output_dir.join('.all-repos-files').remove()
+    assert _find_files(file_config_files, r'\d') == {'repo2': [b'f2']}
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
 import subprocess
+from unittest import mock
+
+import pytest
 
 from all_repos import git
 
@@ -14,3 +17,58 @@ def test_git_remote(tmpdir):
     ))
     subprocess.check_call(('git', 'clone', r1, r2))
     assert git.remote(r2) == r1
+
+
+def test_git_remote_does_not_call_git(tmpdir):
+    subprocess.check_call(('git', 'init', tmpdir))
+    subprocess.check_call((
+        'git', '-C', tmpdir, 'remote', 'add', 'origin', 'git@example:a/b',
+    ))
+    with mock.patch.object(subprocess, 'check_output') as check_output:
+        assert git.remote(tmpdir) == 'git@example:a/b'
+    check_output.assert_not_called()
+
+
+def test_git_remote_falls_back_to_git(tmpdir):
+    subprocess.check_call(('git', 'init', tmpdir))
+    included = tmpdir.join('included')
+    included.write('[remote "origin"]\n\turl = git@example:a/b\n')
+    subprocess.check_call((
+        'git', '-C', tmpdir, 'config', 'include.path', str(included),
+    ))
+    assert git.remote(tmpdir) == 'git@example:a/b'
+
+
+@pytest.mark.parametrize(
+    ('contents', 'expected'),
+    (
+        ('', None),
+        ('[remote "origin"]\n\turl = git@example:a/b\n', 'git@example:a/b'),
+        (
+            '[Remote "origin"]\nURL=git@example:a/b ; comment\n',
+            'git@example:a/b',
+        ),
+        ('[remote.origin]\n\turl = git@example:a/b\n', 'git@example:a/b'),
+        # the last value wins
+        (
+            '[remote "origin"]\n\turl = a\n'
+            '[remote "origin"]\n\turl = b\n',
+            'b',
+        ),
+        # other remotes / sections are ignored
+        (
+            '[core]\n\tbare = false\n\tlogallrefupdates\n'
+            '[remote "upstream"]\n\turl = a\n'
+            '[remote "origin"]\n\turl = b\n'
+            '[branch "main"]\n\tremote = origin\n',
+            'b',
+        ),
+        # anything more complicated is left to git
+        ('[remote "origin"]\n\turl = "quoted"\n', None),
+        ('[remote "origin"]\n\turl = a\\\nb\n', None),
+        ('[include]\n\tpath = other\n[remote "origin"]\n\turl = a\n', None),
+        ('[includeIf "gitdir:/"]\n\tpath = other\n', None),
+    ),
+)
+def test_parse_remote(contents, expected):
+    assert git._parse_remote(contents) == expected
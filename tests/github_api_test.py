@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import pytest
 
+from all_repos.github_api import _page_urls
 from all_repos.github_api import _strip_trailing_dot_git
 from all_repos.github_api import better_repr
 from all_repos.github_api import get_all
@@ -77,3 +78,43 @@ def test_get_all(mock_urlopen):
 )
 def test_strip_trailing_dot_git(val, expected):
     assert _strip_trailing_dot_git(val) == expected
+
+
+def test_get_all_concurrent_pages(mock_urlopen):
+    mock_urlopen.side_effect = urlopen_side_effect({
+        'https://example.com/api?per_page=2': FakeResponse(
+            b'["page1_1", "page1_2"]',
+            next_link='https://example.com/api?per_page=2&page=2',
+            last_link='https://example.com/api?per_page=2&page=4',
+        ),
+        'https://example.com/api?per_page=2&page=2': FakeResponse(
+            b'["page2_1", "page2_2"]',
+        ),
+        'https://example.com/api?per_page=2&page=3': FakeResponse(
+            b'["page3_1", "page3_2"]',
+        ),
+        'https://example.com/api?per_page=2&page=4': FakeResponse(
+            b'["page4_1"]',
+        ),
+    })
+
+    ret = get_all('https://example.com/api?per_page=2', jobs=2)
+    assert ret == [
+        'page1_1', 'page1_2', 'page2_1', 'page2_2', 'page3_1', 'page3_2',
+        'page4_1',
+    ]
+
+
+@pytest.mark.parametrize(
+    'links',
+    (
+        {},
+        {'next': 'https://example.com/api?page=2'},
+        {
+            'next': 'https://example.com/api?cursor=abc',
+            'last': 'https://example.com/api?cursor=def',
+        },
+    ),
+)
+def test_page_urls_unknown(links):
+    assert _page_urls(links) is None
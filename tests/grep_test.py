@@ -5,10 +5,16 @@ from unittest import mock
 
 import pytest
 
+from all_repos import grep as grep_mod
 from all_repos.config import load_config
+from all_repos.grep import _combine
 from all_repos.grep import grep
+from all_repos.grep import grep_iter
+from all_repos.grep import GrepError
 from all_repos.grep import main
 from all_repos.grep import repos_matching
+from all_repos.grep import repos_matching_any
+from all_repos.grep import repos_matching_batch
 
 
 def test_repos_matching(file_config_files):
@@ -24,6 +30,92 @@ def test_repos_matching(file_config_files):
     assert ret == set()
 
 
+def test_repos_matching_batch(file_config_files):
+    config = load_config(file_config_files.cfg)
+    ret = repos_matching_batch(config, (['^OH'], ['^OHAI'], ['nope']))
+    assert ret == [
+        {
+            file_config_files.output_dir.join('repo1'),
+            file_config_files.output_dir.join('repo2'),
+        },
+        {file_config_files.output_dir.join('repo1')},
+        set(),
+    ]
+
+
+def test_repos_matching_any(file_config_files):
+    config = load_config(file_config_files.cfg)
+    ret = repos_matching_any(config, (['^OHAI'], ['^OHELLO'], ['nope']))
+    assert ret == {
+        file_config_files.output_dir.join('repo1'),
+        file_config_files.output_dir.join('repo2'),
+    }
+    assert repos_matching_any(config, (['nope'],)) == set()
+
+
+def _count_greps():
+    return mock.patch.object(
+        grep_mod.subprocess, 'run', wraps=grep_mod.subprocess.run,
+    )
+
+
+def test_repos_matching_any_single_pass(file_config_files):
+    config = load_config(file_config_files.cfg)
+    queries = (['-F', 'nope', '--', 'f'], ['-F', 'also nope', '--', 'f'])
+    with _count_greps() as run:
+        assert repos_matching_any(config, queries) == set()
+    # one combined `git grep` per repository
+    assert run.call_count == 2
+
+
+def test_repos_matching_any_rechecks_differing_pathspecs(file_config_files):
+    config = load_config(file_config_files.cfg)
+    # the combined query matches OHELLO in f, but only f2 is asked for
+    queries = (['^OHAI', '--', 'f'], ['^OHELLO', '--', 'f2'])
+    assert repos_matching_any(config, queries) == {
+        file_config_files.output_dir.join('repo1'),
+    }
+
+
+def test_repos_matching_batch_prefilters(file_config_files):
+    config = load_config(file_config_files.cfg)
+    with _count_greps() as run:
+        ret = repos_matching_batch(config, (['^OHAI'], ['nope']))
+    assert ret == [{file_config_files.output_dir.join('repo1')}, set()]
+    # repo1: combined + each query, repo2: combined only
+    assert run.call_count == 4
+
+
+@pytest.mark.parametrize(
+    ('queries', 'expected'),
+    (
+        ((['a'], ['b']), (('-e', 'a', '-e', 'b', '--'), True)),
+        (
+            (['-F', 'a', '--', 'f'], ['-F', 'b', '--', 'f']),
+            (('-F', '-e', 'a', '-e', 'b', '--', 'f'), True),
+        ),
+        (
+            (['a', '--', 'f'], ['b', '--', 'g', 'f']),
+            (('-e', 'a', '-e', 'b', '--', 'f', 'g'), False),
+        ),
+        ((['a', '--', 'f'], ['b']), (('-e', 'a', '-e', 'b', '--'), False)),
+        ((['-F', 'a'], ['b']), None),
+        ((['-e', 'a'], ['b']), None),
+        ((['a', 'HEAD'], ['b']), None),
+        (([], ['b']), None),
+    ),
+)
+def test_combine(queries, expected):
+    assert _combine(queries) == expected
+
+
+def test_repos_matching_batch_error(file_config_files):
+    config = load_config(file_config_files.cfg)
+    with pytest.raises(GrepError) as excinfo:
+        repos_matching_batch(config, (['^OH'], []))
+    assert excinfo.value.args == (128,)
+
+
 def test_repos_matching_cli(file_config_files, capsys):
     ret = main((
         '-C', str(file_config_files.cfg), '--repos-with-matches', '^OH',
@@ -63,6 +155,24 @@ def test_grep(file_config_files):
     assert ret == {}
 
 
+def test_grep_parallel(file_config_files):
+    config = load_config(file_config_files.cfg)
+    ret = grep(config, ['^OH'], jobs=2)
+    assert ret == {
+        file_config_files.output_dir.join('repo1'): b'f:OHAI\n',
+        file_config_files.output_dir.join('repo2'): b'f:OHELLO\n',
+    }
+
+
+def test_grep_iter(file_config_files):
+    config = load_config(file_config_files.cfg)
+    ret = list(grep_iter(config, ['^OH'], jobs=2))
+    assert ret == [
+        (file_config_files.output_dir.join('repo1'), b'f:OHAI\n'),
+        (file_config_files.output_dir.join('repo2'), b'f:OHELLO\n'),
+    ]
+
+
 def test_grep_cli(file_config_files, capsys):
     ret = main(('-C', str(file_config_files.cfg), '^OH'))
     assert ret == 0
@@ -93,6 +203,16 @@ def test_grep_cli(file_config_files, capsys):
     )
 
 
+def test_grep_cli_jobs(file_config_files, capsys):
+    ret = main(('-C', str(file_config_files.cfg), '-j', '2', '^OH'))
+    assert ret == 0
+    out, _ = capsys.readouterr()
+    assert out == '{}:f:OHAI\n{}:f:OHELLO\n'.format(
+        file_config_files.output_dir.join('repo1'),
+        file_config_files.output_dir.join('repo2'),
+    )
+
+
 def test_grep_cli_output_paths(file_config_files, capsys):
     cmd = ('-C', str(file_config_files.cfg), '-l', '^OH', '--output-paths')
     assert not main(cmd)
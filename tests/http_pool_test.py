@@ -0,0 +1,426 @@
+from __future__ import annotations
+
+import functools
+import http.client
+import http.server
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from all_repos import http_pool
+from all_repos import mapper
+
+
+class Server(http.server.ThreadingHTTPServer):
+    def __init__(self) -> None:
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.connections: set[tuple[str, int]] = set()
+        self.version = 1
+        self.link = '<x>; rel="next"'
+        self.full_responses = 0
+        self.limited_requests = 0
+        self.secondary_requests = 0
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: Server
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, status, body, **headers):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        if self.path == '/redirect':
+            self._respond(301, b'', Location='/ok')
+        elif self.path == '/missing':
+            self._respond(404, b'{"message": "Not Found"}')
+        elif self.path == '/close':
+            self._respond(200, b'"closed"', Connection='close')
+        elif self.path == '/limited':
+            self.server.limited_requests += 1
+            if self.server.limited_requests <= 2:
+                self._respond(
+                    429, b'{"message": "slow down"}', **{'Retry-After': '3'},
+                )
+            else:
+                self._respond(200, b'"ok"')
+        elif self.path == '/secondary':
+            self.server.secondary_requests += 1
+            if self.server.secondary_requests == 1:
+                self._respond(
+                    403,
+                    b'{"message": "You have exceeded a secondary rate limit. '
+                    b'Please wait a few minutes before you try again."}',
+                    **{'X-RateLimit-Remaining': '4000'},
+                )
+            else:
+                self._respond(201, b'"created"')
+        elif self.path == '/exhausted':
+            self._respond(
+                403, b'{"message": "API rate limit exceeded"}',
+                **{
+                    'X-RateLimit-Remaining': '0',
+                    'X-RateLimit-Reset': str(int(time.time()) + 30),
+                },
+            )
+        elif self.path == '/forbidden':
+            self._respond(403, b'{"message": "Forbidden"}')
+        elif self.path.startswith('/etag'):
+            etag = f'"{self.server.version}"'
+            if self.headers['If-None-Match'] == etag:
+                self._respond(304, b'', ETag=etag, Link=self.server.link)
+            else:
+                self.server.full_responses += 1
+                body = json.dumps(self.server.version).encode()
+                self._respond(200, body, ETag=etag, Link=self.server.link)
+        else:
+            ret = json.dumps({
+                'path': self.path,
+                'user_agent': self.headers['User-Agent'],
+            })
+            self._respond(200, ret.encode())
+
+    def do_POST(self):
+        self.server.connections.add(self.client_address)
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.path == '/secondary':
+            self.do_GET()
+        else:
+            self._respond(201, body)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    for var in ('http_proxy', 'HTTP_PROXY', 'https_proxy', 'HTTPS_PROXY'):
+        monkeypatch.delenv(var, raising=False)
+    srv = Server()
+    monkeypatch.setattr(http_pool, '_budgets', {})
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield srv
+    finally:
+        http_pool.close()
+        srv.shutdown()
+        srv.server_close()
+
+
+def _url(server, path):
+    return f'http://127.0.0.1:{server.server_address[1]}{path}'
+
+
+def test_urlopen_reuses_connections(server):
+    for _ in range(3):
+        resp = http_pool.urlopen(urllib.request.Request(_url(server, '/')))
+        assert json.load(resp) == {
+            'path': '/',
+            'user_agent': http_pool.USER_AGENT,
+        }
+    assert len(server.connections) == 1
+
+
+def test_urlopen_post(server):
+    req = urllib.request.Request(
+        _url(server, '/'), data=b'{"hi": 1}', method='POST',
+    )
+    resp = http_pool.urlopen(req)
+    assert resp.status == 201
+    assert json.load(resp) == {'hi': 1}
+
+
+def test_urlopen_follows_redirects(server):
+    resp = http_pool.urlopen(urllib.request.Request(_url(server, '/redirect')))
+    assert json.load(resp)['path'] == '/ok'
+
+
+def test_urlopen_http_error(server):
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        http_pool.urlopen(urllib.request.Request(_url(server, '/missing')))
+    assert excinfo.value.code == 404
+    assert json.load(excinfo.value) == {'message': 'Not Found'}
+
+
+def test_urlopen_connection_close(server):
+    req = urllib.request.Request(_url(server, '/close'))
+    assert json.load(http_pool.urlopen(req)) == 'closed'
+    assert json.load(http_pool.urlopen(req)) == 'closed'
+    assert len(server.connections) == 2
+
+
+def test_urlopen_retries_stale_connection(server):
+    req = urllib.request.Request(_url(server, '/'))
+    http_pool.urlopen(req)
+    # simulate the server having closed the idle connection
+    (conn,), = http_pool._idle.values()
+    conn.sock.close()
+    conn.sock = _ClosedSocket()
+    assert json.load(http_pool.urlopen(req))['path'] == '/'
+
+
+class _ClosedSocket:
+    def sendall(self, data):
+        raise BrokenPipeError
+
+    def close(self):
+        pass
+
+
+def test_urlopen_falls_back_to_urllib_for_proxies(server, monkeypatch):
+    monkeypatch.setenv('http_proxy', 'http://proxy.invalid:1234')
+    monkeypatch.setenv('no_proxy', '127.0.0.1')
+    req = urllib.request.Request(_url(server, '/'))
+    assert http_pool._use_pool(req)
+    monkeypatch.delenv('no_proxy')
+    assert not http_pool._use_pool(req)
+    assert not http_pool._use_pool(urllib.request.Request('file:///tmp'))
+
+
+def test_urlopen_without_pool(server, monkeypatch):
+    monkeypatch.setattr(http_pool, '_use_pool', lambda req: False)
+    resp = http_pool.urlopen(urllib.request.Request(_url(server, '/')))
+    assert resp.status == 200
+    assert json.load(resp)['path'] == '/'
+
+
+def test_after_fork_in_child_drops_connections(server):
+    http_pool.urlopen(urllib.request.Request(_url(server, '/')))
+    assert http_pool._idle
+    http_pool._after_fork_in_child()
+    assert not http_pool._idle
+
+
+def test_cache_conditional_requests(server, tmpdir):
+    cache_dir = tmpdir.join('cache')
+    req = functools.partial(urllib.request.Request, _url(server, '/etag'))
+    with http_pool.cache(str(cache_dir)):
+        assert json.load(http_pool.urlopen(req())) == 1
+    assert len(cache_dir.listdir()) == 1
+
+    with http_pool.cache(str(cache_dir)):
+        resp = http_pool.urlopen(req())
+    assert resp.status == 200
+    assert json.load(resp) == 1
+    assert resp.headers['Link'] == '<x>; rel="next"'
+    assert server.full_responses == 1
+
+    server.version = 2
+    with http_pool.cache(str(cache_dir)):
+        assert json.load(http_pool.urlopen(req())) == 2
+        assert json.load(http_pool.urlopen(req())) == 2
+    assert server.full_responses == 2
+
+
+def test_cache_not_modified_updates_headers(server, tmpdir):
+    req = functools.partial(urllib.request.Request, _url(server, '/etag'))
+    with http_pool.cache(str(tmpdir)):
+        http_pool.urlopen(req())
+
+    # the page is unchanged but a new page was added after it
+    server.link = '<x>; rel="next", <y>; rel="last"'
+    with http_pool.cache(str(tmpdir)):
+        resp = http_pool.urlopen(req())
+    assert json.load(resp) == 1
+    assert resp.headers['Link'] == '<x>; rel="next", <y>; rel="last"'
+    assert resp.headers['ETag'] == '"1"'
+    assert resp.headers['Content-Length'] == '1'
+    assert server.full_responses == 1
+
+    # and the updated headers were stored
+    server.link = '<x>; rel="next", <z>; rel="last"'
+    with http_pool.cache(str(tmpdir)):
+        http_pool.urlopen(req())
+    entry, = (http_pool._cache_load(str(p)) for p in tmpdir.listdir())
+    assert entry is not None
+    link = entry.response().headers['Link']
+    assert link == '<x>; rel="next", <z>; rel="last"'
+
+
+def test_cache_without_pool(server, tmpdir, monkeypatch):
+    monkeypatch.setattr(http_pool, '_use_pool', lambda req: False)
+    req = functools.partial(urllib.request.Request, _url(server, '/etag'))
+    with http_pool.cache(str(tmpdir)):
+        assert json.load(http_pool.urlopen(req())) == 1
+        assert json.load(http_pool.urlopen(req())) == 1
+    assert server.full_responses == 1
+
+
+def test_cache_keyed_on_headers(server, tmpdir):
+    def req(token):
+        return urllib.request.Request(
+            _url(server, '/etag'), headers={'Authorization': token},
+        )
+
+    with http_pool.cache(str(tmpdir)):
+        http_pool.urlopen(req('a'))
+        http_pool.urlopen(req('b'))
+    assert server.full_responses == 2
+    assert len(tmpdir.listdir()) == 2
+
+
+def test_cache_removes_unused_entries(server, tmpdir):
+    with http_pool.cache(str(tmpdir)):
+        http_pool.urlopen(urllib.request.Request(_url(server, '/etag1')))
+    with http_pool.cache(str(tmpdir)):
+        http_pool.urlopen(urllib.request.Request(_url(server, '/etag2')))
+    assert len(tmpdir.listdir()) == 1
+
+
+def test_cache_kept_on_error(server, tmpdir):
+    with http_pool.cache(str(tmpdir)):
+        http_pool.urlopen(urllib.request.Request(_url(server, '/etag1')))
+    with pytest.raises(urllib.error.HTTPError):
+        with http_pool.cache(str(tmpdir)):
+            http_pool.urlopen(urllib.request.Request(_url(server, '/missing')))
+    assert len(tmpdir.listdir()) == 1
+    assert http_pool._cache_dir is None
+
+
+def test_cache_ignores_uncacheable(server, tmpdir):
+    with http_pool.cache(str(tmpdir)):
+        http_pool.urlopen(urllib.request.Request(_url(server, '/')))
+        req = urllib.request.Request(_url(server, '/'), data=b'{}')
+        http_pool.urlopen(req)
+    assert not tmpdir.listdir()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    ret: list[float] = []
+    monkeypatch.setattr(time, 'sleep', ret.append)
+    return ret
+
+
+def test_urlopen_retries_rate_limited(server, sleeps):
+    resp = http_pool.urlopen(urllib.request.Request(_url(server, '/limited')))
+    assert json.load(resp) == 'ok'
+    assert server.limited_requests == 3
+    assert len([s for s in sleeps if s > 2]) == 2
+
+
+def test_urlopen_rate_limited_gives_up(server, sleeps, monkeypatch):
+    monkeypatch.setattr(http_pool, 'MAX_RETRIES', 1)
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        http_pool.urlopen(urllib.request.Request(_url(server, '/exhausted')))
+    assert excinfo.value.code == 403
+    # waits until the reset
+    assert 25 < max(sleeps) <= 30
+
+
+def test_urlopen_forbidden_not_retried(server, sleeps):
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        http_pool.urlopen(urllib.request.Request(_url(server, '/forbidden')))
+    assert excinfo.value.code == 403
+    assert not any(sleeps)
+
+
+def test_urlopen_retries_secondary_rate_limit(server, sleeps):
+    req = urllib.request.Request(_url(server, '/secondary'))
+    assert json.load(http_pool.urlopen(req)) == 'created'
+    assert server.secondary_requests == 2
+    assert 59 < max(sleeps) <= 60
+
+
+def test_urlopen_error_body_still_readable(server, sleeps):
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        http_pool.urlopen(urllib.request.Request(_url(server, '/forbidden')))
+    assert json.load(excinfo.value) == {'message': 'Forbidden'}
+
+
+def _budget(remaining, reset):
+    ret = http_pool._Budget()
+    ret.remaining = remaining
+    ret.reset = reset
+    return ret
+
+
+def test_budget_reserve_unknown():
+    now = time.time()
+    assert now <= http_pool._Budget().reserve(mutating=False) < now + 1
+
+
+def test_budget_reserve_exhausted():
+    reset = time.time() + 60
+    assert _budget(0, reset).reserve(mutating=False) == reset
+
+
+def test_budget_reserve_paced():
+    budget = _budget(10, time.time() + 100)
+    times = [budget.reserve(mutating=False) for _ in range(3)]
+    assert 9 < times[1] - times[0] < 11
+    assert 9 < times[2] - times[1] < 12
+    assert budget.remaining == 7
+
+
+def test_budget_reserve_mutating_spaced():
+    budget = http_pool._Budget()
+    first = budget.reserve(mutating=True)
+    assert budget.reserve(mutating=False) < first + 1
+    second = budget.reserve(mutating=True)
+    assert second == first + http_pool.MUTATING_INTERVAL
+
+
+def _reserve_mutating(_: int) -> float:
+    # in a worker process, each with its own budgets
+    return http_pool._Budget().reserve(mutating=True)
+
+
+def test_mutating_clock_shared_between_processes():
+    with mapper.process_executor(
+            2,
+            initializer=http_pool.use_mutating_clock,
+            initargs=(http_pool.mutating_clock(),),
+    ) as ex:
+        times = sorted(ex.map(_reserve_mutating, range(4)))
+    spacing = [b - a for a, b in zip(times, times[1:])]
+    assert spacing == [pytest.approx(http_pool.MUTATING_INTERVAL)] * 3
+
+
+def test_mutating_clock_held_back_by_rate_limit(server, sleeps, monkeypatch):
+    clock = http_pool.mutating_clock()
+    monkeypatch.setattr(http_pool, '_mutating_clock', clock)
+    req = urllib.request.Request(_url(server, '/secondary'), data=b'{}')
+    http_pool.urlopen(req)
+    assert clock.value > time.time() + http_pool.SECONDARY_BACKOFF - 1
+
+
+def test_budget_update_out_of_order():
+    budget = _budget(10, 1700000000)
+    headers = http.client.HTTPMessage()
+    headers['X-RateLimit-Remaining'] = '12'
+    headers['X-RateLimit-Reset'] = '1700000000'
+    budget.update(headers)
+    assert budget.remaining == 10
+    # a new window
+    headers.replace_header('X-RateLimit-Reset', '1700003600')
+    budget.update(headers)
+    assert (budget.remaining, budget.reset) == (12, 1700003600)
+
+
+@pytest.mark.parametrize(
+    ('value', 'expected'),
+    (
+        (None, None),
+        ('5', 5),
+        ('garbage', None),
+        ('Wed, 21 Oct 2015 07:28:00 GMT', 1445412480),
+    ),
+)
+def test_retry_after(value, expected, monkeypatch):
+    monkeypatch.setattr(time, 'time', lambda: 0)
+    headers = http.client.HTTPMessage()
+    if value is not None:
+        headers['Retry-After'] = value
+    assert http_pool._retry_after(headers) == expected
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import os.path
+import sqlite3
+import subprocess
+
+import pytest
+
+from all_repos import clone
+from all_repos import index
+from all_repos.config import load_config
+from all_repos.grep import grep
+from all_repos.grep import repos_matching
+from testing.git import write_file_commit
+
+
+@pytest.mark.parametrize(
+    ('pattern', 'expected'),
+    (
+        (b'hello', [b'hello']),
+        (b'a.b*c', [b'a', b'', b'c']),
+        (b'^foo[a-z]+bar$', [b'', b'foo', b'', b'bar', b'']),
+        (b'x[]]y[^]]z', [b'x', b'y', b'z']),
+        (b'foo[bar', []),
+        (b'(foo)?', []),
+        (b'foo|bar', []),
+        (b'fo\\o', []),
+        (b'[[:space:]]foo', []),
+    ),
+)
+def test_literal_runs(pattern, expected):
+    assert index._literal_runs(pattern) == expected
+
+
+@pytest.mark.parametrize(
+    ('args', 'expected'),
+    (
+        (
+            ('hello',),
+            index._GrepArgs(frozenset((b'hel', b'ell', b'llo')), False),
+        ),
+        (('-F', 'a.b'), index._GrepArgs(frozenset((b'a.b',)), False)),
+        (('-e', 'ABC'), index._GrepArgs(frozenset((b'abc',)), False)),
+        (('-in', 'ABC'), index._GrepArgs(frozenset((b'abc',)), False)),
+        (
+            ('--color=always', '--quiet', 'abc', '--', 'setup.py'),
+            index._GrepArgs(frozenset((b'abc',)), True),
+        ),
+        (('-F', '-E', 'a.b'), None),
+        (('ab',), None),
+        (('abc', 'HEAD'), None),
+        (('-e', 'abc', '-e', 'def'), None),
+        (('-v', 'abc'), None),
+        (('-lv', 'abc'), None),
+        (('--invert-match', 'abc'), None),
+        (('abc\ndef',), None),
+        (('-i', 'héllo'), None),
+        ((), None),
+    ),
+)
+def test_parse_grep_args(args, expected):
+    assert index._parse_grep_args(args) == expected
+
+
+@pytest.fixture
+def indexed_config(file_config_files):
+    write_file_commit(file_config_files.dir2, 'g', 'hello world\n')
+    clone.main(('--config-filename', str(file_config_files.cfg)))
+    assert not index.main(('--config-filename', str(file_config_files.cfg)))
+    return file_config_files
+
+
+def test_query_without_index(file_config_files):
+    config = load_config(file_config_files.cfg)
+    assert index.query(config, ('OHAI',)) is None
+
+
+def test_query_not_indexable(indexed_config):
+    config = load_config(indexed_config.cfg)
+    assert index.query(config, ('a|b',)) is None
+
+
+def test_query_prunes_repos_and_files(indexed_config):
+    config = load_config(indexed_config.cfg)
+    query = index.query(config, ('OHAI',))
+    assert query is not None
+    assert query.args_for('repo1') == ('OHAI', '--', ':(literal)f')
+    assert query.args_for('repo2') is None
+    # repositories which are not indexed are searched normally
+    assert query.args_for('repo3') == ('OHAI',)
+
+
+def test_query_with_pathspecs(indexed_config):
+    config = load_config(indexed_config.cfg)
+    query = index.query(config, ('OHAI', '--', 'f'))
+    assert query is not None
+    assert query.args_for('repo1') == ('OHAI', '--', 'f')
+    assert query.args_for('repo2') is None
+
+
+def test_grep_with_index(indexed_config):
+    config = load_config(indexed_config.cfg)
+    assert grep(config, ['-i', 'WORLD']) == {
+        indexed_config.output_dir.join('repo2'): b'g:hello world\n',
+    }
+    assert grep(config, ['^OH']) == {
+        indexed_config.output_dir.join('repo1'): b'f:OHAI\n',
+        indexed_config.output_dir.join('repo2'): b'f:OHELLO\n',
+    }
+    assert repos_matching(config, ['OHAI']) == {
+        indexed_config.output_dir.join('repo1'),
+    }
+
+
+def test_unindexed_files_are_always_candidates(file_config_files):
+    write_file_commit(file_config_files.dir1, 'big', 'x' * 16)
+    clone.main(('--config-filename', str(file_config_files.cfg)))
+    config = load_config(file_config_files.cfg)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(index, 'MAX_FILE_SIZE', 8)
+        index.update(config, config.get_cloned_repos(), jobs=1)
+    query = index.query(config, ('xxx',))
+    assert query is not None
+    assert query.args_for('repo1') == ('xxx', '--', ':(literal)big')
+
+
+def test_query_ignores_stale_index(indexed_config):
+    config = load_config(indexed_config.cfg)
+    write_file_commit(indexed_config.dir2, 'new', 'NEWSTRING\n')
+    # pulled outside of `all-repos-clone`, so the index is not updated
+    repo2 = indexed_config.output_dir.join('repo2')
+    subprocess.check_call(('git', '-C', repo2, 'pull', '--quiet'))
+
+    query = index.query(config, ('NEWSTRING',))
+    assert query is not None
+    assert query.args_for('repo1') is None
+    assert query.args_for('repo2') == ('NEWSTRING',)
+    assert grep(config, ['NEWSTRING']) == {repo2: b'new:NEWSTRING\n'}
+
+
+def test_head_commit(tmpdir):
+    subprocess.check_call(('git', 'init', '--quiet', tmpdir))
+    assert index._head_commit(str(tmpdir)) is None
+
+    write_file_commit(tmpdir, 'f', 'hi\n')
+    head = subprocess.check_output(
+        ('git', '-C', tmpdir, 'rev-parse', 'HEAD'),
+    ).decode().strip()
+    assert index._head_commit(str(tmpdir)) == head
+
+    subprocess.check_call(('git', '-C', tmpdir, 'pack-refs', '--all'))
+    assert index._head_commit(str(tmpdir)) == head
+
+    subprocess.check_call(('git', '-C', tmpdir, 'checkout', '-q', head))
+    assert index._head_commit(str(tmpdir)) == head
+
+
+def test_index_from_older_version(file_config_files):
+    config = load_config(file_config_files.cfg)
+    with sqlite3.connect(config.index_path) as db:
+        db.execute('CREATE TABLE repos (repo TEXT PRIMARY KEY, tree TEXT)')
+    assert index.query(config, ('OHAI',)) is None
+
+    index.update(config, config.get_cloned_repos(), jobs=1)
+    query = index.query(config, ('OHAI',))
+    assert query is not None
+    assert query.args_for('repo2') is None
+
+
+def test_clone_updates_index(indexed_config):
+    config = load_config(indexed_config.cfg)
+    write_file_commit(indexed_config.dir1, 'new', 'brand new\n')
+    assert not clone.main(('--config-filename', str(indexed_config.cfg)))
+    assert grep(config, ['brand']) == {
+        indexed_config.output_dir.join('repo1'): b'new:brand new\n',
+    }
+
+    subprocess.check_call(('git', '-C', indexed_config.dir1, 'rm', 'new'))
+    subprocess.check_call(('git', '-C', indexed_config.dir1, 'commit', '-mrm'))
+    assert not clone.main(('--config-filename', str(indexed_config.cfg)))
+    assert grep(config, ['brand']) == {}
+
+    # trees which are no longer referenced are removed
+    with sqlite3.connect(config.index_path) as db:
+        count, = db.execute('SELECT COUNT(*) FROM trees').fetchone()
+    assert count == 2
+
+
+def test_clone_does_not_create_index(file_config_files):
+    config = load_config(file_config_files.cfg)
+    assert not os.path.exists(config.index_path)
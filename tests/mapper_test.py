@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import sys
+
 import pytest
 
 from all_repos import mapper
@@ -16,6 +18,10 @@ def square(n):
         mapper.process_mapper(2),
         mapper.thread_mapper(1),
         mapper.thread_mapper(2),
+        mapper.bounded_thread_mapper(1),
+        mapper.bounded_thread_mapper(2),
+        mapper.bounded_process_mapper(1),
+        mapper.bounded_process_mapper(2),
     ),
 )
 def test_mappers(ctx):
@@ -23,6 +29,37 @@ def test_mappers(ctx):
         assert tuple(do_map(square, (3, 4, 5))) == (9, 16, 25)
 
 
+def test_bounded_thread_mapper_more_items_than_window():
+    with mapper.bounded_thread_mapper(2) as do_map:
+        assert tuple(do_map(square, range(20))) == tuple(
+            n * n for n in range(20)
+        )
+
+
+def test_bounded_process_mapper_more_items_than_window():
+    with mapper.bounded_process_mapper(2) as do_map:
+        assert tuple(do_map(square, range(20))) == tuple(
+            n * n for n in range(20)
+        )
+
+
+def get_flag(_):
+    return FLAG
+
+
+FLAG = 'imported'
+
+
+@pytest.mark.parametrize(
+    'ctx', (mapper.process_mapper(2), mapper.bounded_process_mapper(2)),
+)
+def test_process_mappers_do_not_fork(ctx, monkeypatch):
+    # a forked worker would inherit the patched state
+    monkeypatch.setattr(sys.modules[__name__], 'FLAG', 'patched')
+    with ctx as do_map:
+        assert tuple(do_map(get_flag, (1, 2))) == ('imported', 'imported')
+
+
 def test_exhaust():
     def gen():
         yield 1
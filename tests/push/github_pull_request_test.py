@@ -34,7 +34,8 @@ def test_github_pull_request(mock_urlopen, fake_github_repo):
     mock_urlopen.return_value.read.return_value = json.dumps(resp).encode()
 
     with fake_github_repo.dest.as_cwd():
-        github_pull_request.push(fake_github_repo.settings, 'feature')
+        url = github_pull_request.push(fake_github_repo.settings, 'feature')
+    assert url == 'https://example/com'
 
     # Should have pushed the branch to origin
     out = subprocess.check_output((
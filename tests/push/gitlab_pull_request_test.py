@@ -34,7 +34,8 @@ def test_gitlab_pull_request(mock_urlopen, fake_gitlab_repo):
     mock_urlopen.return_value.read.return_value = json.dumps(resp).encode()
 
     with fake_gitlab_repo.dest.as_cwd():
-        gitlab_pull_request.push(fake_gitlab_repo.settings, 'feature')
+        url = gitlab_pull_request.push(fake_gitlab_repo.settings, 'feature')
+    assert url == 'https://example/com'
 
     # Should have pushed the branch to origin
     out = subprocess.check_output((
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import pytest
+
+from all_repos.repo_metadata import parse_id
+from all_repos.repo_metadata import parse_timestamp
+from all_repos.repo_metadata import remotes
+from all_repos.repo_metadata import RepoMetadata
+
+
+@pytest.mark.parametrize(
+    ('s', 'expected'),
+    (
+        (None, None),
+        ('2017-08-15T02:16:02Z', 1502763362.0),
+        ('2020-12-16T10:18:40.051Z', 1608113920.051),
+        ('2019-04-10T14:30:40.087251+00:00', 1554906640.087251),
+    ),
+)
+def test_parse_timestamp(s, expected):
+    assert parse_timestamp(s) == expected
+
+
+@pytest.mark.parametrize(
+    ('value', 'expected'),
+    ((None, None), (123, '123'), ('{uuid}', '{uuid}')),
+)
+def test_parse_id(value, expected):
+    assert parse_id(value) == expected
+
+
+def test_remotes():
+    metadata = {'a': RepoMetadata('git@a'), 'b': RepoMetadata('git@b', 'm')}
+    assert remotes(metadata) == {'a': 'git@a', 'b': 'git@b'}
@@ -1,6 +1,14 @@
 from __future__ import annotations
 
+from unittest import mock
+
+import pytest
+
+from all_repos import autofix_lib
 from all_repos import clone
+from all_repos import mapper
+from all_repos.config import load_config
+from all_repos.sed import find_repos
 from all_repos.sed import main
 from testing.git import commit
 from testing.git import write_file_commit
@@ -41,3 +49,43 @@ def test_main_custom_file_pattern(file_config_files):
     assert file_config_files.dir1.join('f').read() == 'OHAI\n'
     assert file_config_files.dir1.join('g').read() == 'OHIE\n'
     assert file_config_files.dir2.join('f').read() == 'OHELLO\n'
+
+
+def test_main_ignores_binary_files(file_config_files):
+    write_file_commit(file_config_files.dir1, 'b', '\0HAI\n')
+    clone.main(('--config-filename', str(file_config_files.cfg)))
+    test_main(file_config_files)
+    assert file_config_files.dir1.join('b').read() == '\0HAI\n'
+
+
+def test_main_runs_sed_once_per_repository(file_config_files):
+    write_file_commit(file_config_files.dir1, 'g', 'OHAI\n')
+    clone.main(('--config-filename', str(file_config_files.cfg)))
+    with mock.patch.object(
+            autofix_lib, 'run', wraps=autofix_lib.run,
+    ) as run:
+        test_main(file_config_files)
+    assert file_config_files.dir1.join('g').read() == 'OBAI\n'
+    sed_calls = [c for c in run.call_args_list if c.args[0] == 'sed']
+    assert [c.args[-2:] for c in sed_calls] == [('f', 'g'), ('f', 'f2')]
+
+
+def test_main_passes_jobs_to_find_repos(file_config_files):
+    with mock.patch.object(
+            mapper, 'bounded_thread_mapper',
+            wraps=mapper.bounded_thread_mapper,
+    ) as bounded_thread_mapper:
+        assert not main((
+            '--config-filename', str(file_config_files.cfg), '--jobs', '3',
+            's/HAI/BAI/g', '*',
+        ))
+    bounded_thread_mapper.assert_called_once_with(3)
+    assert file_config_files.dir1.join('f').read() == 'OBAI\n'
+
+
+@pytest.mark.parametrize('jobs', (1, 2))
+def test_find_repos(file_config_files, jobs):
+    config = load_config(str(file_config_files.cfg))
+    ls_files_cmd = ('git', 'ls-files', '-z', '--', 'f2')
+    ret = find_repos(config, ls_files_cmd=ls_files_cmd, jobs=jobs)
+    assert list(ret) == [str(file_config_files.output_dir.join('repo2'))]
@@ -4,6 +4,7 @@ import json
 
 import pytest
 
+from all_repos.source.azure_repos import _default_branch
 from all_repos.source.azure_repos import list_repos
 from all_repos.source.azure_repos import Settings
 from testing.mock_http import FakeResponse
@@ -39,6 +40,18 @@ def test_list_repos():
     }
 
 
+@pytest.mark.parametrize(
+    ('repo', 'expected'),
+    (
+        ({'defaultBranch': 'refs/heads/main'}, 'main'),
+        ({'defaultBranch': 'refs/tags/v1'}, None),
+        ({}, None),
+    ),
+)
+def test_default_branch(repo, expected):
+    assert _default_branch(repo) == expected
+
+
 def test_settings_repr():
     settings = Settings(
         api_key='fake-token',
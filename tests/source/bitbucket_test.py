@@ -4,7 +4,9 @@ import json
 
 import pytest
 
+from all_repos.repo_metadata import RepoMetadata
 from all_repos.source.bitbucket import list_repos
+from all_repos.source.bitbucket import list_repos_metadata
 from all_repos.source.bitbucket import Settings
 from testing.mock_http import FakeResponse
 from testing.mock_http import urlopen_side_effect
@@ -32,6 +34,19 @@ def test_list_repos():
     }
 
 
+@pytest.mark.usefixtures('repos_response')
+def test_list_repos_metadata():
+    settings = Settings('cool_user', 'app_password')
+    ret = list_repos_metadata(settings)
+    assert ret == {
+        'fake_org/fake_repo': RepoMetadata(
+            remote='git@bitbucket.org:fake_org/fake_repo.git',
+            default_branch='main',
+            repo_id='{69765507-c17b-49c4-8757-5c2c2e46a50a}',
+        ),
+    }
+
+
 def test_settings_repr():
     assert repr(Settings('cool_user', 'app_password')) == (
         'Settings(\n'
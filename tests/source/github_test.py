@@ -6,7 +6,9 @@ from unittest import mock
 
 import pytest
 
+from all_repos.repo_metadata import RepoMetadata
 from all_repos.source.github import list_repos
+from all_repos.source.github import list_repos_metadata
 from all_repos.source.github import Settings
 from testing.mock_http import FakeResponse
 from testing.mock_http import urlopen_side_effect
@@ -62,6 +64,20 @@ def test_list_repos(settings, expected_repo_names):
     assert set(ret) == expected_repo_names
 
 
+@pytest.mark.usefixtures('repos_response')
+def test_list_repos_metadata():
+    settings = Settings(api_key='key', username='user')
+    ret = list_repos_metadata(settings)
+    assert ret == {
+        'asottile/git-code-debt': RepoMetadata(
+            remote='git@github.com:asottile/git-code-debt',
+            default_branch='main',
+            pushed_at=1502763362.0,
+            repo_id='14399837',
+        ),
+    }
+
+
 def test_settings_repr():
     settings = Settings(api_key='api_key', username='user')
 
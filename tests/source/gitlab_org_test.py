@@ -4,7 +4,9 @@ import json
 
 import pytest
 
+from all_repos.repo_metadata import RepoMetadata
 from all_repos.source.gitlab_org import list_repos
+from all_repos.source.gitlab_org import list_repos_metadata
 from all_repos.source.gitlab_org import Settings
 from testing.mock_http import FakeResponse
 from testing.mock_http import urlopen_side_effect
@@ -34,6 +36,19 @@ def test_list_repos(repos_response):
     assert ret == expected
 
 
+def test_list_repos_metadata(repos_response):
+    settings = Settings(api_key='key', org='ronny-test')
+    ret = list_repos_metadata(settings)
+    assert ret == {
+        'ronny-test/test-repo': RepoMetadata(
+            remote='git@gitlab.com:ronny-test/test-repo.git',
+            default_branch='main',
+            pushed_at=1608113920.051 + 2 * 60 * 60,
+            repo_id='23139935',
+        ),
+    }
+
+
 def test_settings_repr():
     assert repr(Settings(api_key='key', org='sass')) == (
         'Settings(\n'